@@ -1,19 +1,25 @@
 # face_sorter_gui.py
 
 import os
+import queue
+import threading
 import time
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
-from face_sorter_backend import load_known_face, scan_and_save_all
+from face_sorter_backend import scan_and_save_all, ScanControl, ScanCancelled
+from face_sorter_gallery import GALLERY_DIR, GalleryIndex
+from face_sorter_metrics import REPORT_FILENAME, STAGES
+from face_sorter_models import register_heif_opener, start_warm_up
+from face_sorter_store import RESULTS_DB_FILENAME, ResultsStore
 from PIL import Image, ImageTk
-import pillow_heif
 import tkinter as tk
 
-pillow_heif.register_heif_opener()
-
 ctk.set_appearance_mode("System")
 ctk.set_default_color_theme("blue")
 
+SCAN_POLL_MS = 100  # how often the UI drains scan progress events
+WARM_UP_DELAY_MS = 200  # face models load in the background once the window is up
+
 
 class FaceSorterApp(ctk.CTk):
     def __init__(self):
@@ -24,12 +30,16 @@ class FaceSorterApp(ctk.CTk):
         # self.resizable(False, False)
 
         self.known_people = []  # List of tuples: (name, encoding, image_path)
+        self.gallery = GalleryIndex.load(os.path.abspath(GALLERY_DIR))
         self.people_widgets = {}  # name -> (row_frame, img_label, name_label, del_btn, photoimage_ref)
 
         self.video_dir = os.path.abspath("videos")
         self.output_dir = os.path.abspath("output")
 
         self.scan_start_time = None
+        self.scan_thread = None
+        self.scan_control = None
+        self.scan_events = None
         self.fun_messages = [
             "Discombobulating the combobulators...",
             "Calibrating face lasers...",
@@ -41,6 +51,8 @@ class FaceSorterApp(ctk.CTk):
         ]
 
         self.build_ui()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(WARM_UP_DELAY_MS, start_warm_up)
 
     def build_ui(self):
         # Title
@@ -54,9 +66,12 @@ class FaceSorterApp(ctk.CTk):
         self.person_name_entry = ctk.CTkEntry(input_frame, placeholder_text="Enter person name")
         self.person_name_entry.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
 
-        self.add_person_btn = ctk.CTkButton(input_frame, text="➕ Add Person Image", command=self.add_person_image)
+        self.add_person_btn = ctk.CTkButton(input_frame, text="➕ Add Person Images", command=self.add_person_image)
         self.add_person_btn.grid(row=0, column=1, padx=10, pady=10)
 
+        self.load_gallery_btn = ctk.CTkButton(input_frame, text="📚 Load Gallery", command=self.load_gallery)
+        self.load_gallery_btn.grid(row=0, column=2, padx=(0, 10), pady=10)
+
         input_frame.columnconfigure(0, weight=1)
 
         # People list label
@@ -88,9 +103,33 @@ class FaceSorterApp(ctk.CTk):
         self.video_dir_btn = ctk.CTkButton(self, text=f"🎞️ Select Videos Folder (Current: {self.video_dir})", command=self.select_video_dir)
         self.video_dir_btn.pack(pady=(15, 10), padx=20, fill="x")
 
-        # Start scan button
-        self.start_scan_btn = ctk.CTkButton(self, text="🚀 Start Scanning", command=self.start_scanning, height=40)
-        self.start_scan_btn.pack(pady=10, padx=20, fill="x")
+        # Scan options
+        options_frame = ctk.CTkFrame(self, fg_color="transparent")
+        options_frame.pack(padx=20, pady=(0, 5), fill="x")
+
+        scale_label = ctk.CTkLabel(options_frame, text="🔎 Detection scale:")
+        scale_label.pack(side="left", padx=(0, 10))
+
+        self.detection_scale_menu = ctk.CTkOptionMenu(
+            options_frame, values=["auto", "1.0", "0.75", "0.5", "0.25"], width=100
+        )
+        self.detection_scale_menu.set("auto")
+        self.detection_scale_menu.pack(side="left")
+
+        # Start / pause / cancel buttons
+        scan_buttons_frame = ctk.CTkFrame(self, fg_color="transparent")
+        scan_buttons_frame.pack(pady=10, padx=20, fill="x")
+
+        self.start_scan_btn = ctk.CTkButton(scan_buttons_frame, text="🚀 Start Scanning", command=self.start_scanning, height=40)
+        self.start_scan_btn.pack(side="left", fill="x", expand=True)
+
+        self.cancel_btn = ctk.CTkButton(scan_buttons_frame, text="🛑 Cancel", command=self.cancel_scan, height=40,
+                                        width=110, state="disabled")
+        self.cancel_btn.pack(side="right", padx=(10, 0))
+
+        self.pause_btn = ctk.CTkButton(scan_buttons_frame, text="⏸️ Pause", command=self.toggle_pause, height=40,
+                                       width=110, state="disabled")
+        self.pause_btn.pack(side="right", padx=(10, 0))
 
         # Progress bar + percentage
         progress_frame = ctk.CTkFrame(self, fg_color="transparent")
@@ -103,6 +142,10 @@ class FaceSorterApp(ctk.CTk):
         self.percent_label = ctk.CTkLabel(progress_frame, text="0%", font=ctk.CTkFont(size=14, weight="bold"))
         self.percent_label.pack(side="right")
 
+        # Per-frame status of the videos being scanned
+        self.frame_status_label = ctk.CTkLabel(self, text="", font=ctk.CTkFont(size=12))
+        self.frame_status_label.pack(padx=20, anchor="w")
+
         # Output display box
         self.output_box = ctk.CTkTextbox(self, wrap="word", font=ctk.CTkFont(size=13), height=280)
         self.output_box.pack(padx=20, pady=(15, 10), fill="both", expand=True)
@@ -114,7 +157,6 @@ class FaceSorterApp(ctk.CTk):
         self.output_box.insert("end", text + "\n")
         self.output_box.see("end")
         self.output_box.configure(state="disabled")
-        self.update()
 
     def add_person_image(self):
         name = self.person_name_entry.get().strip()
@@ -122,44 +164,105 @@ class FaceSorterApp(ctk.CTk):
             messagebox.showerror("Input Error", "Please enter a name first.")
             return
 
-        file_path = filedialog.askopenfilename(
-            title="Select Reference Image",
+        file_paths = filedialog.askopenfilenames(
+            title="Select Reference Images",
             filetypes=[
                 ("Image files", "*.jpg *.jpeg *.png *.heic *.webp *.bmp *.tiff *.gif"),
                 ("All files", "*.*")
             ]
         )
-        if not file_path:
+        if not file_paths:
             return
 
-        try:
-            # Validate image can be opened (pillow_heif handles HEIC)
-            with Image.open(file_path) as img:
-                img.verify()
+        # Check for duplicate name
+        if any(p[0] == name for p in self.known_people):
+            messagebox.showerror("Duplicate Name", f"A person named '{name}' has already been added.")
+            return
 
-            encoding = load_known_face(file_path)
-            if encoding is None:
-                raise ValueError("No face encoding found in the image.")
+        try:
+            # Validate images can be opened (pillow_heif handles HEIC)
+            register_heif_opener()
+            for file_path in file_paths:
+                with Image.open(file_path) as img:
+                    img.verify()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load image or face encoding:\n{e}")
+            return
 
-            # Check for duplicate name
-            if any(p[0] == name for p in self.known_people):
-                messagebox.showerror("Duplicate Name", f"A person named '{name}' has already been added.")
+        def encode():
+            # Photos join the person's gallery folder; only new ones are encoded
+            no_face = self.gallery.add_images(name, file_paths)
+            return no_face, self.gallery.known_people(names=[name])
+
+        def added(result):
+            no_face, people = result
+            for path in no_face:
+                self.log(f"⚠️ No face found in {os.path.basename(path)}")
+            if not people:
+                messagebox.showerror("Error", "Failed to load image or face encoding:\n"
+                                              "No face encoding found in the selected images.")
                 return
 
-            # Add to known_people list: store name, encoding, and image path for thumbnail
-            self.known_people.append((name, encoding, file_path))
+            # Add to known_people list: name, encoding, and image path for thumbnail
+            self.known_people.extend(people)
 
             # Add UI entry with thumbnail
-            self._add_person_ui_row(name, file_path)
+            self._add_person_ui_row(name, people[0][2])
 
-            self.log(f"✅ Added '{name}' from {os.path.basename(file_path)}")
+            self.log(f"✅ Added '{name}' from {len(file_paths) - len(no_face)} image(s)")
             self.person_name_entry.delete(0, "end")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load image or face encoding:\n{e}")
+
+        self.log(f"⏳ Encoding {len(file_paths)} image(s) of '{name}'...")
+        self._run_gallery_task(encode, added, "Failed to load image or face encoding")
+
+    def load_gallery(self):
+        def loaded(gallery):
+            added = [n for n in gallery.names() if not any(p[0] == n for p in self.known_people)]
+            for name in added:
+                people = gallery.known_people(names=[name])
+                self.known_people.extend(people)
+                self._add_person_ui_row(name, people[0][2])
+            self.log(f"📚 Loaded {len(added)} people from {gallery.gallery_dir}")
+
+        self.log("⏳ Encoding the gallery...")
+        self._run_gallery_task(self.gallery.update, loaded, "Failed to load the gallery")
+
+    def _run_gallery_task(self, work, on_done, error_message):
+        """
+        Runs work() on a thread, with the controls disabled, so encoding
+        reference photos never freezes the window; on_done(result) then
+        runs on the Tk thread, through the same after() polling as scans.
+        """
+        results = queue.Queue()
+
+        def run():
+            # Runs on the gallery thread: never touch widgets here
+            try:
+                start_warm_up().join()  # encoding forks workers; not while an import is half done
+                results.put(("done", work()))
+            except Exception as e:
+                results.put(("error", e))
+
+        def poll():
+            try:
+                kind, payload = results.get_nowait()
+            except queue.Empty:
+                self.after(SCAN_POLL_MS, poll)
+                return
+            self.enable_ui()
+            if kind == "error":
+                messagebox.showerror("Error", f"{error_message}:\n{payload}")
+            else:
+                on_done(payload)
+
+        self.disable_ui(scanning=False)
+        threading.Thread(target=run, daemon=True).start()
+        self.after(SCAN_POLL_MS, poll)
 
     def _add_person_ui_row(self, name, image_path):
         # Create thumbnail
         try:
+            register_heif_opener()
             thumb = Image.open(image_path)
             thumb.thumbnail((40, 40))
             photo = ImageTk.PhotoImage(thumb)
@@ -226,33 +329,119 @@ class FaceSorterApp(ctk.CTk):
         self.percent_label.configure(text="0%")
         self.log("🔍 Starting scan across selected videos...\n")
 
+        self.scan_control = ScanControl()
+        self.scan_events = queue.Queue()
+        self.scan_thread = threading.Thread(
+            target=self._run_scan,
+            args=(list(self.known_people), self.video_dir, self.output_dir, self.get_detection_scale()),
+            daemon=True
+        )
+        self.scan_thread.start()
+        self.after(SCAN_POLL_MS, self._poll_scan_events)
+
+    def _run_scan(self, known_people, video_dir, output_dir, detection_scale):
+        # Runs on the scan thread: never touch widgets here, only post events
+        events = self.scan_events
+        stats = {}
         try:
+            start_warm_up().join()  # workers may be forked; not while an import is half done
             saved_files = scan_and_save_all(
-                self.known_people,
-                self.video_dir,
-                self.output_dir,
-                progress_callback=self.update_progress
+                known_people,
+                video_dir,
+                output_dir,
+                progress_callback=lambda *args: events.put(("video", args)),
+                frame_callback=lambda *args: events.put(("frames", args)),
+                detection_scale=detection_scale,
+                stats=stats,
+                control=self.scan_control
             )
-
-            if saved_files:
-                self.log("\n✅ Scan complete! See matched results below:\n")
-                for filepath in saved_files:
-                    try:
-                        self.log(f"📄 {os.path.basename(filepath)}:")
-                        with open(filepath, "r") as f:
-                            lines = ["    " + line.strip() for line in f.readlines() if line.strip()]
-                            self.log("\n".join(lines) + "\n")
-                    except Exception as read_err:
-                        self.log(f"❌ Could not read {filepath}: {read_err}\n")
+            events.put(("done", (saved_files, stats)))
+        except ScanCancelled:
+            events.put(("cancelled", None))
+        except Exception as e:
+            events.put(("error", e))
+
+    def _poll_scan_events(self):
+        while True:
+            try:
+                kind, payload = self.scan_events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "video":
+                self.update_progress(*payload)
+            elif kind == "frames":
+                self.update_frame_progress(*payload)
             else:
-                self.log("⚠️ Scan finished but no matches were found.")
+                self._finish_scan(kind, payload)
+                return
+        self.after(SCAN_POLL_MS, self._poll_scan_events)
 
-        except Exception as e:
-            messagebox.showerror("Scan Error", f"An error occurred during scanning:\n{e}")
-        finally:
-            self.enable_ui()
-            self.progress_bar.set(1)
-            self.percent_label.configure(text="100%")
+    def _finish_scan(self, kind, payload):
+        self.scan_thread = None
+        self.enable_ui()
+        self.frame_status_label.configure(text="")
+
+        if kind == "cancelled":
+            self.log("\n🛑 Scan cancelled. Progress is kept; start scanning again to resume.")
+            return
+        if kind == "error":
+            messagebox.showerror("Scan Error", f"An error occurred during scanning:\n{payload}")
+            return
+
+        saved_files, stats = payload
+        self.progress_bar.set(1)
+        self.percent_label.configure(text="100%")
+        self.log(
+            f"\n📊 {stats.get('detector_calls', 0)} of {stats.get('samples', 0)} sampled frames ran detection "
+            f"({stats.get('gated_samples', 0)} unchanged frames skipped, "
+            f"{stats.get('cache_hits', 0)} videos read from cache, "
+            f"{stats.get('videos_skipped', 0)} already-completed videos skipped)"
+        )
+        self.log(
+            "⏱️ " + " · ".join(f"{stage} {stats.get(f'{stage}_seconds', 0.0):.1f}s" for stage in STAGES)
+            + f" · {stats.get('errors', 0)} errors (details in {REPORT_FILENAME})"
+        )
+
+        if saved_files:
+            self.log("\n✅ Scan complete! See matched results below:\n")
+            try:
+                with ResultsStore(os.path.join(self.output_dir, RESULTS_DB_FILENAME)) as store:
+                    for name in dict.fromkeys(p[0] for p in self.known_people):
+                        self.log(f"📄 {name}_videos.txt:")
+                        lines = ["    " + line for line in store.person_text_lines(name)]
+                        self.log("\n".join(lines) + "\n")
+            except Exception as read_err:
+                self.log(f"❌ Could not read results: {read_err}\n")
+        else:
+            self.log("⚠️ Scan finished but no matches were found.")
+
+    def toggle_pause(self):
+        if not self.scan_thread:
+            return
+        if self.scan_control.paused:
+            self.scan_control.resume()
+            self.pause_btn.configure(text="⏸️ Pause")
+            self.log("▶️ Resumed.")
+        else:
+            self.scan_control.pause()
+            self.pause_btn.configure(text="▶️ Resume")
+            self.log("⏸️ Paused after the current frame.")
+
+    def cancel_scan(self):
+        if self.scan_thread:
+            self.scan_control.cancel()
+            self.cancel_btn.configure(state="disabled")
+            self.pause_btn.configure(state="disabled")
+            self.log("🛑 Cancelling...")
+
+    def on_close(self):
+        if self.scan_thread:
+            self.scan_control.cancel()
+        self.destroy()
+
+    def get_detection_scale(self):
+        value = self.detection_scale_menu.get()
+        return value if value == "auto" else float(value)
 
     def update_progress(self, current_idx, total, video_name, *args):
         progress_fraction = current_idx / total
@@ -267,17 +456,31 @@ class FaceSorterApp(ctk.CTk):
         fun_message = self.fun_messages[(current_idx - 1) % len(self.fun_messages)]
         self.log(f"🎬 Video {current_idx}/{total}: {video_name} | ETA: {eta_str} | {fun_message}")
 
-    def disable_ui(self):
+    def update_frame_progress(self, video_name, frames_done, frames_total, fps):
+        self.frame_status_label.configure(
+            text=f"🎞️ {video_name}: frame {frames_done}/{frames_total} · {fps:.1f} frames/s"
+        )
+
+    def disable_ui(self, scanning=True):
         self.add_person_btn.configure(state="disabled")
+        self.load_gallery_btn.configure(state="disabled")
         self.start_scan_btn.configure(state="disabled")
         self.video_dir_btn.configure(state="disabled")
+        self.detection_scale_menu.configure(state="disabled")
         self.person_name_entry.configure(state="disabled")
+        if scanning:
+            self.pause_btn.configure(state="normal", text="⏸️ Pause")
+            self.cancel_btn.configure(state="normal")
 
     def enable_ui(self):
         self.add_person_btn.configure(state="normal")
+        self.load_gallery_btn.configure(state="normal")
         self.start_scan_btn.configure(state="normal")
         self.video_dir_btn.configure(state="normal")
+        self.detection_scale_menu.configure(state="normal")
         self.person_name_entry.configure(state="normal")
+        self.pause_btn.configure(state="disabled", text="⏸️ Pause")
+        self.cancel_btn.configure(state="disabled")
 
 
 if __name__ == "__main__":
@@ -1,110 +1,1405 @@
 # face_sorter_backend.py
 
 import os
-from moviepy import VideoFileClip
+import collections
+import contextlib
+import functools
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 import numpy as np
-import face_recognition
+from PIL import Image, UnidentifiedImageError
+from face_sorter_cache import FaceCache
+from face_sorter_manifest import ScanManifest, scan_key
+from face_sorter_metrics import REPORT_FILENAME, RunMetrics, add_time, merge_stats, peak_memory, stage_timer, timed
+from face_sorter_models import register_heif_opener
+from face_sorter_store import RESULTS_DB_FILENAME, ResultsStore, format_span, format_timestamp
+from face_sorter_video import iter_keyframes, iter_sampled_frames, probe_video
 
 FRAME_INTERVAL = 2.0
 TOLERANCE = 0.5
+DETECTION_MODEL = "hog"
+UPSAMPLE_TIMES = 1
+# Detect faces on frames shrunk by this factor ("auto" picks one from the
+# resolution so the short side is at most AUTO_DETECTION_SIDE pixels)
+DETECTION_SCALE = 1.0
+AUTO_DETECTION_SIDE = 1080
+# Adaptive sampling: the coarse pass samples every frame_interval * ADAPTIVE_COARSE_FACTOR
+# seconds, so appearances shorter than that can be missed; boundaries are located to
+# ADAPTIVE_MIN_STEP (or frame_interval, if finer)
+ADAPTIVE_COARSE_FACTOR = 2.0
+ADAPTIVE_MIN_STEP = 0.5
+# Samples whose grayscale thumbnail differs from the last detected frame by
+# less than this mean absolute difference (0-255) reuse its detection; 0 disables
+GATE_THRESHOLD = 1.0
+GATE_THUMB_SIZE = 32
+# A thumbnail difference this large is taken as a scene cut, which ends every face track
+SCENE_CUT_THRESHOLD = 30.0
+# Tracked faces reuse their encoding for up to this many samples (0 encodes every face)
+TRACK_REENCODE_EVERY = 5
+TRACK_MIN_IOU = 0.3        # box overlap needed to continue a track
+TRACK_CONFIDENT_IOU = 0.6  # below this the face is re-encoded even if tracked
+# A re-encoded face this far from its track's last encoding starts a new track
+# (face_recognition's default tolerance, looser than TOLERANCE so pose changes don't split)
+TRACK_SPLIT_DISTANCE = 0.6
+EVENT_POLL_SECONDS = 0.1   # how often a pooled scan relays worker progress
+CHECKPOINT_EVERY = 30      # samples between resumable checkpoints of a video
+NUM_WORKERS = 1  # processes used by scan_and_save_all; 1 scans in-process
+PIPELINE_DECODE_AHEAD = 8  # decoded samples queued for a pipelined scan
+PIPELINE_FRAMES_PER_WORKER = 2  # samples in flight per worker of a pipelined scan
+TRIAGE_MIN_GAP = 5.0  # seconds between the keyframes a triage examines
+CACHE_DIRNAME = ".face_cache"
+
+# One row per detected face; encodings are stored as float32 to halve cache size
+FACE_DTYPE = np.dtype([
+    ("t", np.float64),
+    ("box", np.int32, (4,)),  # (top, right, bottom, left) as returned by face_locations
+    ("encoding", np.float32, (128,)),
+    ("track", np.int32),  # FaceTracker id; faces sharing it are one tracked face
+])
+
+# Set once per worker process by _init_worker so known encodings are only pickled per worker
+_worker = {}
+
+
+class ScanCancelled(Exception):
+    """
+    Raised out of a scan whose ScanControl was cancelled.
+    """
+
+
+class ScanControl:
+    """
+    Cooperative pause and cancel for a running scan.
+
+    Scans call checkpoint() between frames. The state lives in
+    multiprocessing events, so one ScanControl also steers the worker
+    processes of a pooled scan.
+    """
+
+    def __init__(self):
+        self._cancelled = multiprocessing.Event()
+        self._running = multiprocessing.Event()
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()  # wake paused scans so they can stop
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def checkpoint(self):
+        """
+        Blocks while paused and raises ScanCancelled once cancelled.
+        """
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise ScanCancelled()
 
 
 def load_known_face(image_path):
-    image = face_recognition.load_image_file(image_path)
+    import face_recognition
+
+    register_heif_opener()
+    try:
+        image = face_recognition.load_image_file(image_path)
+    except (UnidentifiedImageError, FileNotFoundError) as e:
+        raise ValueError(f"Cannot open image file: {e}")
     encodings = face_recognition.face_encodings(image)
     if not encodings:
         raise ValueError(f"No face found in image: {image_path}")
     return encodings[0]
 
 
-def format_timestamp(seconds):
-    minutes = int(seconds // 60)
-    secs = int(seconds % 60)
-    return f"{minutes:02d}:{secs:02d}"
+def format_hit(hit):
+    """
+    Formats a sample time as "MM:SS" or a (start, end[, confidence]) hit as
+    "MM:SS-MM:SS" ("MM:SS" when it starts and ends on the same second).
+    """
+    if isinstance(hit, tuple):
+        return format_span(hit[0], hit[1])
+    return format_timestamp(hit)
+
+
+def pack_known_encodings(known_people):
+    """
+    Packs the encodings of known_people into a single (people, 128) matrix.
+    Returns (names, matrix) with names[i] owning matrix[i]. A person with
+    several reference encodings appears once per encoding.
+    """
+    names = [person[0] for person in known_people]
+    matrix = np.array([person[1] for person in known_people], dtype=np.float64).reshape(len(names), 128)
+    return names, matrix
 
 
-def find_person_timestamps_multi(video_path, known_people):
+def person_rows(names):
     """
-    known_people: list of tuples (name, encoding, image_path)
+    Maps each row of a packed matrix to the first row with the same name,
+    so a person with several reference encodings matches and votes as one.
+    """
+    first = {}
+    return np.array([first.setdefault(name, idx) for idx, name in enumerate(names)], dtype=np.intp)
+
+
+def match_encodings(face_encodings, known_matrix, tolerance=TOLERANCE, return_distances=False):
+    """
+    Assigns each face encoding to its nearest row of known_matrix.
+
+    Returns an int array with one entry per face: the index of the nearest
+    known encoding, or -1 when that nearest distance is above tolerance
+    (same <= semantics as face_recognition.compare_faces). With
+    return_distances=True, returns (indices, nearest distances) instead.
+    """
+    if len(face_encodings) == 0 or len(known_matrix) == 0:
+        unmatched = np.full(len(face_encodings), -1, dtype=np.intp)
+        return (unmatched, np.full(len(face_encodings), np.inf)) if return_distances else unmatched
+    faces = np.asarray(face_encodings, dtype=np.float64).reshape(len(face_encodings), -1)
+
+    # Squared euclidean distances for every face/person pair in one product
+    sq_dists = (
+        np.einsum("ij,ij->i", faces, faces)[:, None]
+        + np.einsum("ij,ij->i", known_matrix, known_matrix)[None, :]
+        - 2.0 * faces @ known_matrix.T
+    )
+    nearest = np.argmin(sq_dists, axis=1)
+    # Recompute the winning distances exactly so the tolerance edge matches face_distance
+    best = np.linalg.norm(faces - known_matrix[nearest], axis=1)
+    matched = np.where(best <= tolerance, nearest, -1)
+    return (matched, best) if return_distances else matched
+
+
+def match_confidence(distance):
+    """
+    Confidence of a match from its face distance: 1 - distance, clipped to [0, 1].
+    """
+    return float(min(1.0, max(0.0, 1.0 - distance)))
+
+
+def detector_settings(frame_interval=None, detection_scale=None, gate_threshold=None, track_reencode_every=None):
+    """
+    Settings that decide which faces and encodings a scan produces; unset
+    values fall back to the module defaults. The returned dict is passed
+    down to the per-video scan, and cached face records are only reused
+    when it matches. An invalid detection_scale raises ValueError here,
+    before any video is read.
+    """
+    detection_scale = DETECTION_SCALE if detection_scale is None else detection_scale
+    check_detection_scale(detection_scale)
+    return {
+        "frame_interval": FRAME_INTERVAL if frame_interval is None else frame_interval,
+        "model": DETECTION_MODEL,
+        "upsample": UPSAMPLE_TIMES,
+        "detection_scale": detection_scale,
+        "gate_threshold": GATE_THRESHOLD if gate_threshold is None else gate_threshold,
+        "track_reencode_every": TRACK_REENCODE_EVERY if track_reencode_every is None else track_reencode_every,
+    }
+
+
+def count(stats, key, amount=1):
+    """
+    Adds amount to stats[key] when a stats dict is being collected.
+    """
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + amount
+
+
+class FrameGate:
+    """
+    Cheap change detector in front of face detection.
+
+    Each frame is reduced to a small grayscale thumbnail and compared with
+    the thumbnail of the last frame that was actually processed; when the
+    mean absolute difference (0-255 scale) is below threshold, the frame is
+    considered unchanged and its detection can be reused. Comparing against
+    the last processed frame, not the previous sample, keeps slow drift from
+    accumulating unnoticed. A threshold of 0 disables gating.
+
+    After each changed() call, cut is True when the difference reached
+    cut_threshold, i.e. the frame looks like a new shot rather than the
+    same one moving on; the FaceTracker then ends its tracks.
+    """
+
+    def __init__(self, threshold=GATE_THRESHOLD, thumb_size=GATE_THUMB_SIZE, cut_threshold=SCENE_CUT_THRESHOLD):
+        self.threshold = threshold
+        self.thumb_size = thumb_size
+        self.cut_threshold = cut_threshold
+        self.last_thumb = None
+        self.cut = False
+
+    def thumbnail(self, frame):
+        # Stride down first so PIL only touches a few thousand pixels
+        step = max(1, min(frame.shape[:2]) // (self.thumb_size * 4))
+        small = Image.fromarray(np.ascontiguousarray(frame[::step, ::step])).convert("L")
+        return np.asarray(small.resize((self.thumb_size, self.thumb_size), Image.BILINEAR), dtype=np.float32)
+
+    def changed(self, frame):
+        """
+        Returns True when frame needs fresh detection.
+        """
+        self.cut = False
+        if self.threshold <= 0 and self.cut_threshold <= 0:
+            return True
+        thumb = self.thumbnail(frame)
+        if self.last_thumb is not None:
+            diff = np.mean(np.abs(thumb - self.last_thumb))
+            if diff < self.threshold:
+                return False
+            self.cut = 0 < self.cut_threshold <= diff
+        self.last_thumb = thumb
+        return True
+
+
+def check_detection_scale(detection_scale):
+    """
+    Returns detection_scale if it is "auto" or a number in (0, 1], and
+    raises ValueError otherwise.
+    """
+    if detection_scale == "auto":
+        return detection_scale
+    try:
+        scale = float(detection_scale)
+    except (TypeError, ValueError):
+        scale = None
+    if scale is None or not 0 < scale <= 1:
+        raise ValueError(f"detection_scale must be in (0, 1] or 'auto', got {detection_scale!r}")
+    return detection_scale
+
+
+def resolve_detection_scale(detection_scale, frame_shape):
+    """
+    Turns a detection_scale setting into a factor in (0, 1]. "auto" shrinks
+    frames so their short side is at most AUTO_DETECTION_SIDE pixels.
+    """
+    if check_detection_scale(detection_scale) == "auto":
+        return min(1.0, AUTO_DETECTION_SIDE / min(frame_shape[:2]))
+    return float(detection_scale)
+
+
+def detect_faces(frame, scale=1.0, model=DETECTION_MODEL, upsample=UPSAMPLE_TIMES):
+    """
+    Runs face detection on a copy of frame downscaled by scale and returns
+    the boxes mapped back to frame's full-resolution coordinates.
+    """
+    import face_recognition
+
+    if scale >= 1.0:
+        return face_recognition.face_locations(frame, number_of_times_to_upsample=upsample, model=model)
+
+    height, width = frame.shape[:2]
+    small_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    small = np.asarray(Image.fromarray(frame).resize(small_size, Image.BILINEAR))
+    sx = width / small_size[0]
+    sy = height / small_size[1]
+    return [
+        (max(0, round(top * sy)), min(width, round(right * sx)), min(height, round(bottom * sy)), max(0, round(left * sx)))
+        for top, right, bottom, left in face_recognition.face_locations(
+            small, number_of_times_to_upsample=upsample, model=model
+        )
+    ]
+
+
+def box_iou(box_a, box_b):
+    """
+    Intersection over union of two (top, right, bottom, left) boxes.
+    """
+    top, right = max(box_a[0], box_b[0]), min(box_a[1], box_b[1])
+    bottom, left = min(box_a[2], box_b[2]), max(box_a[3], box_b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    if inter == 0:
+        return 0.0
+    area_a = (box_a[1] - box_a[3]) * (box_a[2] - box_a[0])
+    area_b = (box_b[1] - box_b[3]) * (box_b[2] - box_b[0])
+    return inter / float(area_a + area_b - inter)
+
+
+class FaceTracker:
+    """
+    Carries faces across consecutive samples by box overlap so a steadily
+    tracked face is not re-encoded on every sample.
+
+    Each detected box is greedily paired with the previous sample's track of
+    highest IoU (at least min_iou). A paired face reuses the track's
+    encoding while the overlap stays at or above confident_iou and the
+    encoding is younger than reencode_every samples; anything else is
+    encoded fresh. Tracks that are not seen on a sample end, and so do all
+    tracks at a scene cut. Boxes alone cannot tell two people apart in the
+    same framing, so a paired face whose fresh encoding is more than
+    split_distance from its track's last one starts a new track instead.
+    """
+
+    def __init__(self, reencode_every=TRACK_REENCODE_EVERY, min_iou=TRACK_MIN_IOU, confident_iou=TRACK_CONFIDENT_IOU,
+                 split_distance=TRACK_SPLIT_DISTANCE):
+        self.reencode_every = reencode_every
+        self.min_iou = min_iou
+        self.confident_iou = confident_iou
+        self.split_distance = split_distance
+        self.tracks = {}  # track id -> (box, samples since encoded)
+        self.encodings = {}  # track id -> latest encoding
+        self.aliases = {}  # assigned track id -> id it was split into
+        self.next_id = 0
+
+    def update(self, frame, face_locations, stats=None, cut=False):
+        """
+        Returns (face_encodings, track_ids) for face_locations on frame.
+        """
+        import face_recognition
+
+        track_ids, to_encode = self.assign(face_locations, cut)
+        fresh = []
+        if to_encode:
+            fresh = face_recognition.face_encodings(frame, [face_locations[idx] for idx in to_encode])
+        return self.resolve(track_ids, to_encode, fresh, stats), track_ids
+
+    def assign(self, face_locations, cut=False):
+        """
+        Pairs face_locations with the tracks of the previous sample (none
+        when cut is True) and returns (track_ids, to_encode): the track of
+        each face and the indices of the faces that need a fresh encoding.
+        Only boxes are used, so the next sample can be assigned before
+        these faces are encoded; resolve() may still split a track.
+        """
+        if cut:
+            self.tracks = {}
+        pairs = sorted(
+            ((box_iou(box, track[0]), face_idx, track_id)
+             for face_idx, box in enumerate(face_locations)
+             for track_id, track in self.tracks.items()),
+            reverse=True,
+        )
+        track_ids = [None] * len(face_locations)
+        reuse = [False] * len(face_locations)
+        used_tracks = set()
+        for iou, face_idx, track_id in pairs:
+            if iou < self.min_iou:
+                break
+            if track_ids[face_idx] is not None or track_id in used_tracks:
+                continue
+            track_ids[face_idx] = track_id
+            used_tracks.add(track_id)
+            if iou >= self.confident_iou and self.tracks[track_id][1] + 1 < self.reencode_every:
+                reuse[face_idx] = True
+
+        tracks = {}
+        for idx, box in enumerate(face_locations):
+            if track_ids[idx] is None:
+                track_ids[idx] = self.next_id
+                self.next_id += 1
+            tracks[track_ids[idx]] = (box, self.tracks[track_ids[idx]][1] + 1 if reuse[idx] else 0)
+        self.tracks = tracks
+        return track_ids, [idx for idx in range(len(face_locations)) if not reuse[idx]]
+
+    def resolve(self, track_ids, to_encode, fresh, stats=None):
+        """
+        Returns the encodings of an assigned sample, given the fresh
+        encodings of its faces in to_encode; the other faces reuse their
+        track's encoding. A fresh encoding that disagrees with its track's
+        last one moves the face to a new track, updating track_ids in
+        place; samples already assigned to the old track follow it there.
+        Samples must be resolved in the order they were assigned.
+        """
+        fresh = dict(zip(to_encode, fresh))
+        encodings = []
+        for idx, track_id in enumerate(track_ids):
+            while track_id in self.aliases:
+                track_id = self.aliases[track_id]
+            if idx in fresh:
+                previous = self.encodings.get(track_id)
+                if previous is not None and np.linalg.norm(np.asarray(fresh[idx]) - previous) > self.split_distance:
+                    self.aliases[track_ids[idx]] = self.next_id
+                    track_id = self.next_id
+                    self.next_id += 1
+                    count(stats, "track_splits")
+            track_ids[idx] = track_id
+            encodings.append(fresh[idx] if idx in fresh else self.encodings[track_id])
+        self.encodings = dict(zip(track_ids, encodings))
+        count(stats, "faces_encoded", len(fresh))
+        count(stats, "faces_reused", len(track_ids) - len(fresh))
+        return encodings
+
+
+def vote_by_track(matched, track_ids):
+    """
+    Replaces each face's match with the majority identity of its track, so a
+    tracked face keeps one identity through poor angles and brief
+    mismatches. Tracks with no matched face stay unmatched (-1).
+    """
+    voted = np.asarray(matched).copy()
+    track_ids = np.asarray(track_ids)
+    for track_id in np.unique(track_ids):
+        members = track_ids == track_id
+        votes = voted[members]
+        votes = votes[votes >= 0]
+        if len(votes):
+            voted[members] = np.bincount(votes).argmax()
+    return voted
+
+
+def iter_video_faces(video_path, settings=None, stats=None, control=None, on_progress=None, start_time=0.0):
+    """
+    Yields (t, face_locations, face_encodings, track_ids) for each sampled
+    frame of video_path. Faces are found on a frame downscaled per
+    settings["detection_scale"], but always encoded from the
+    full-resolution frame. Frames the FrameGate sees as unchanged reuse the
+    previous detection, and faces the FaceTracker follows reuse their
+    previous encoding.
+
+    If stats is a dict, "samples", "detector_calls", "gated_samples",
+    "faces_detected", "faces_encoded" and "faces_reused" are incremented as
+    frames are processed, and the decode, gate, detect and encode stage
+    timers ("<stage>_seconds") accumulate. control (a ScanControl) is
+    checked before every frame, and on_progress(frames_done, frames_total,
+    frames_per_second) is called after each one. Sampling starts at
+    start_time seconds.
+    """
+    if settings is None:
+        settings = detector_settings()
+    interval = settings["frame_interval"]
+    probe = probe_video(video_path)
+    frames_total = int(np.ceil(probe[2] / interval))
+    frames_skipped = int(round(start_time / interval))
+    gate = FrameGate(settings["gate_threshold"])
+    tracker = FaceTracker(settings["track_reencode_every"])
+    scale = None
+    face_locations, frame_encodings, track_ids = [], [], []
+    started = time.perf_counter()
+    # Each frame is done with before the next is read, so one buffer is reused throughout
+    samples = timed(iter_sampled_frames(video_path, interval, start_time, probe=probe, buffers=1), stats, "decode")
+    for frames_done, (t, frame) in enumerate(samples, start=frames_skipped + 1):
+        if control is not None:
+            control.checkpoint()
+        count(stats, "samples")
+        with stage_timer(stats, "gate"):
+            changed = gate.changed(frame)
+        if changed:
+            if scale is None:
+                scale = resolve_detection_scale(settings["detection_scale"], frame.shape)
+            with stage_timer(stats, "detect"):
+                face_locations = detect_faces(frame, scale, settings["model"], settings["upsample"])
+            with stage_timer(stats, "encode"):
+                frame_encodings, track_ids = tracker.update(frame, face_locations, stats, gate.cut)
+            count(stats, "detector_calls")
+            count(stats, "faces_detected", len(face_locations))
+        else:
+            count(stats, "gated_samples")
+        if on_progress:
+            fps = (frames_done - frames_skipped) / max(time.perf_counter() - started, 1e-6)
+            on_progress(frames_done, frames_total, fps)
+        yield t, face_locations, frame_encodings, track_ids
+
+
+def _init_pool_worker(initializer, initargs):
+    # Ctrl-C reaches the whole process group; the parent cancels through control
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+@contextlib.contextmanager
+def worker_pool(num_workers, initializer=None, initargs=(), control=None, mp_context=None):
+    """
+    ProcessPoolExecutor for scanning: workers ignore SIGINT and run
+    initializer(*initargs). If the block raises (including ScanCancelled,
+    KeyboardInterrupt, or a generator using the pool being closed), control
+    is cancelled so running workers stop at their next checkpoint, queued
+    work is dropped, and the workers are waited for before re-raising.
+    """
+    pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=mp_context, initializer=_init_pool_worker,
+                               initargs=(initializer, initargs))
+    try:
+        yield pool
+    except BaseException:
+        if control is not None:
+            control.cancel()
+        pool.shutdown(wait=True, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
+
+
+def _detect_job(frame, scale, model, upsample):
+    started = time.perf_counter()
+    face_locations = detect_faces(frame, scale, model, upsample)
+    return face_locations, time.perf_counter() - started
+
+
+def _encode_job(frame, face_locations):
+    import face_recognition
+
+    started = time.perf_counter()
+    encodings = face_recognition.face_encodings(frame, face_locations)
+    return encodings, time.perf_counter() - started
+
+
+def _put_until_stopped(items, item, stop):
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=EVENT_POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _decode_ahead(samples, gate, items, stop, stats):
+    # Decoder thread of a pipelined scan: puts (t, frame, changed, cut) for each
+    # sample, then None at the end or the exception that stopped decoding
+    item = None
+    try:
+        for t, frame in samples:
+            with stage_timer(stats, "gate"):
+                changed = gate.changed(frame)
+            if not _put_until_stopped(items, (t, frame, changed, gate.cut), stop):
+                return
+    except Exception as e:
+        item = e
+    finally:
+        samples.close()
+    _put_until_stopped(items, item, stop)
+
+
+def iter_video_faces_pipelined(video_path, settings=None, stats=None, control=None, on_progress=None,
+                               start_time=0.0, num_workers=None):
+    """
+    Same as iter_video_faces, but spreads one video over num_workers
+    processes so a single long video can use every core.
+
+    A decoder thread samples and gates frames into a queue of
+    PIPELINE_DECODE_AHEAD frames. Detection of up to
+    PIPELINE_FRAMES_PER_WORKER samples per worker runs in the pool at
+    once; as detections come back in order, the FaceTracker assigns tracks
+    and the faces that need encoding go back to the pool. Samples are
+    yielded in order once encoded, so the output is identical to
+    iter_video_faces and memory stays bounded by the number of frames in
+    flight. The detect and encode stage timers add up worker time, so
+    together they can exceed the wall time.
     """
-    results = {name: [] for name, _, _ in known_people}
+    if settings is None:
+        settings = detector_settings()
+    num_workers = num_workers or os.cpu_count() or 1
+    interval = settings["frame_interval"]
+    probe = probe_video(video_path)
+    frames_total = int(np.ceil(probe[2] / interval))
+    frames_done = int(round(start_time / interval))
+    frames_skipped = frames_done
+    tracker = FaceTracker(settings["track_reencode_every"])
+    decoder_stats = {}
+    items = queue.Queue(maxsize=PIPELINE_DECODE_AHEAD)
+    stop = threading.Event()
+    max_in_flight = num_workers * PIPELINE_FRAMES_PER_WORKER
+    # A frame is held while queued, while in flight (until its jobs have
+    # been sent and finished) and while being gated or handed over, so
+    # this many buffers are never overwritten while still in use
+    buffers = PIPELINE_DECODE_AHEAD + max_in_flight + 2
+    samples = timed(iter_sampled_frames(video_path, interval, start_time, probe=probe, buffers=buffers),
+                    decoder_stats, "decode")
+    decoder = threading.Thread(
+        target=_decode_ahead,
+        args=(samples, FrameGate(settings["gate_threshold"]), items, stop, decoder_stats),
+        daemon=True,
+    )
+    # Spawned, not forked: a forked worker would inherit the ffmpeg pipe and
+    # keep ffmpeg blocked on it when the scan stops early
+    pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_pool_worker, initargs=(None, ()))
+    in_flight = collections.deque()  # samples in order, as dicts
+    assigned = 0  # leading entries of in_flight whose tracks are assigned
+    decoded_all = False
+    scale = None
+    face_locations, frame_encodings, track_ids = [], [], []
+    started = time.perf_counter()
+    decoder.start()
     try:
-        clip = VideoFileClip(video_path)
-        duration = clip.duration
-        for t in np.arange(0, duration, FRAME_INTERVAL):
-            frame = clip.get_frame(t)
-            face_locations = face_recognition.face_locations(frame)
+        while in_flight or not decoded_all:
+            if control is not None:
+                control.checkpoint()
+
+            while not decoded_all and len(in_flight) < max_in_flight:
+                try:
+                    item = items.get(block=not in_flight, timeout=EVENT_POLL_SECONDS)
+                except queue.Empty:
+                    break
+                if item is None:
+                    decoded_all = True
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                t, frame, changed, cut = item
+                sample = {"t": t, "frame": frame, "cut": cut, "detect": None, "encode": None}
+                if changed:
+                    if scale is None:
+                        scale = resolve_detection_scale(settings["detection_scale"], frame.shape)
+                    sample["detect"] = pool.submit(_detect_job, frame, scale, settings["model"], settings["upsample"])
+                in_flight.append(sample)
+
+            # Tracks must be assigned in sample order
+            while assigned < len(in_flight):
+                sample = in_flight[assigned]
+                if sample["detect"] is not None:
+                    if not sample["detect"].done():
+                        break
+                    boxes, seconds = sample["detect"].result()
+                    add_time(stats, "detect", seconds)
+                    sample["boxes"] = boxes
+                    sample["track_ids"], sample["to_encode"] = tracker.assign(boxes, sample["cut"])
+                    if sample["to_encode"]:
+                        sample["encode"] = pool.submit(_encode_job, sample["frame"],
+                                                       [boxes[idx] for idx in sample["to_encode"]])
+                assigned += 1
+
+            if not in_flight:
+                continue
+            sample = in_flight[0]
+            if not assigned or (sample["encode"] is not None and not sample["encode"].done()):
+                next_detect = in_flight[assigned]["detect"] if assigned < len(in_flight) else None
+                wait([future for future in (sample["encode"], next_detect) if future is not None],
+                     timeout=EVENT_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                continue
+
+            in_flight.popleft()
+            assigned -= 1
+            count(stats, "samples")
+            if sample["detect"] is not None:
+                fresh = []
+                if sample["encode"] is not None:
+                    fresh, seconds = sample["encode"].result()
+                    add_time(stats, "encode", seconds)
+                face_locations, track_ids = sample["boxes"], sample["track_ids"]
+                frame_encodings = tracker.resolve(track_ids, sample["to_encode"], fresh, stats)
+                count(stats, "detector_calls")
+                count(stats, "faces_detected", len(face_locations))
+            else:
+                count(stats, "gated_samples")
+            frames_done += 1
+            if on_progress:
+                fps = (frames_done - frames_skipped) / max(time.perf_counter() - started, 1e-6)
+                on_progress(frames_done, frames_total, fps)
+            yield sample["t"], face_locations, frame_encodings, track_ids
+    finally:
+        stop.set()
+        decoder.join()
+        pool.shutdown(wait=True, cancel_futures=True)
+        for key, value in decoder_stats.items():
+            count(stats, key, value)
+
+
+def faces_to_records(frames):
+    """
+    Flattens (t, face_locations, face_encodings, track_ids) tuples into a
+    FACE_DTYPE array.
+    """
+    rows = [
+        (t, box, enc, track_id)
+        for t, face_locations, frame_encodings, track_ids in frames
+        for box, enc, track_id in zip(face_locations, frame_encodings, track_ids)
+    ]
+    return np.array(rows, dtype=FACE_DTYPE)
+
+
+def load_video_faces(video_path, cache=None, settings=None, stats=None, control=None, on_progress=None,
+                     start_time=0.0, on_checkpoint=None, pipeline_workers=None):
+    """
+    Returns the FACE_DTYPE records for every face on the sampled frames of
+    video_path, reading them from cache when present. A video that fails
+    part-way returns what was read so far, counts one "errors" in stats,
+    and is not cached.
+
+    When decoding from start_time > 0, only the rest of the video is read
+    and the (partial) records are not cached. If on_checkpoint is given, it
+    is called every CHECKPOINT_EVERY samples as on_checkpoint(t, records)
+    with the last sampled timestamp and the records collected so far.
+    With pipeline_workers > 1, the video is decoded through
+    iter_video_faces_pipelined using that many processes.
+    """
+    if settings is None:
+        settings = detector_settings()
+    if cache is not None:
+        records = cache.get(video_path, settings, dtype=FACE_DTYPE)
+        if records is not None:
+            count(stats, "cache_hits")
+            return records
+
+    frames = []
+    if pipeline_workers and pipeline_workers > 1:
+        video_faces = iter_video_faces_pipelined(video_path, settings, stats, control, on_progress, start_time,
+                                                 pipeline_workers)
+    else:
+        video_faces = iter_video_faces(video_path, settings, stats, control, on_progress, start_time)
+    try:
+        for frame in video_faces:
+            frames.append(frame)
+            if on_checkpoint and len(frames) % CHECKPOINT_EVERY == 0:
+                on_checkpoint(frame[0], faces_to_records(frames))
+    except ScanCancelled:
+        raise
+    except Exception as e:
+        print(f"Error processing {video_path}: {e}")
+        count(stats, "errors")
+        return faces_to_records(frames)
+
+    records = faces_to_records(frames)
+    if cache is not None and start_time <= 0:
+        cache.put(video_path, settings, records)
+    return records
+
+
+def match_video_records(records, names, known_matrix):
+    """
+    Matches FACE_DTYPE records against packed known encodings.
+    Returns { name: [(t, t, confidence), ...] } sorted by t, one hit per
+    sample, where confidence is the best match_confidence of the person's
+    faces on that sample (measured against the identity voted for the track).
+    """
+    best = {name: {} for name in names}
+    rows = person_rows(names)
+    matched = match_encodings(records["encoding"], known_matrix)
+    matched = vote_by_track(np.where(matched >= 0, rows[np.maximum(matched, 0)], -1), records["track"])
+    hit = matched >= 0
+    if hit.any():
+        # Distance to the nearest reference encoding of the voted person
+        faces = records["encoding"][hit].astype(np.float64)
+        distances = np.empty(len(faces))
+        for person in np.unique(matched[hit]):
+            members = matched[hit] == person
+            person_matrix = known_matrix[rows == person]
+            member_faces = faces[members]
+            sq_dists = (
+                np.einsum("ij,ij->i", member_faces, member_faces)[:, None]
+                + np.einsum("ij,ij->i", person_matrix, person_matrix)[None, :]
+                - 2.0 * member_faces @ person_matrix.T
+            )
+            distances[members] = np.sqrt(np.maximum(np.min(sq_dists, axis=1), 0.0))
+        for t, idx, distance in zip(records["t"][hit].tolist(), matched[hit].tolist(), distances.tolist()):
+            t = round(t, 2)
+            confidence = match_confidence(distance)
+            if confidence > best[names[idx]].get(t, -1.0):
+                best[names[idx]][t] = confidence
+
+    return {name: [(t, t, confidence) for t, confidence in sorted(hits.items())] for name, hits in best.items()}
+
+
+def find_person_timestamps_multi(video_path, known_people, cache=None, settings=None, stats=None,
+                                 control=None, on_progress=None, start_time=0.0, on_checkpoint=None,
+                                 pipeline_workers=None):
+    """
+    Returns { name: [sorted unique timestamps] } for known_people in
+    video_path; see find_person_hits for the arguments.
+    """
+    hits = find_person_hits(video_path, known_people, cache, settings, stats, control, on_progress,
+                            start_time, on_checkpoint, pipeline_workers)
+    return {name: [start for start, _, _ in person_hits] for name, person_hits in hits.items()}
+
+
+def find_person_hits(video_path, known_people, cache=None, settings=None, stats=None,
+                     control=None, on_progress=None, start_time=0.0, on_checkpoint=None, pipeline_workers=None):
+    """
+    Returns { name: [(t, t, confidence), ...] } for every sample a person
+    is seen on, as from match_video_records.
+
+    known_people: list of tuples (name, encoding, image_path)
+    cache: optional FaceCache; when it holds this video, no frames are decoded
+    settings: dict from detector_settings(), defaults to the module settings
+    stats, control, on_progress: optional counters, ScanControl and
+    progress callback, see iter_video_faces; stats also gets "matches"
+    and the match stage timer
+    start_time: resume sampling at this timestamp instead of 0
+    on_checkpoint: optional on_checkpoint(t, partial_hits), called
+    periodically with the hits up to sample t
+    pipeline_workers: processes that share the decoding of this one video
+    (see iter_video_faces_pipelined); 1 or None decodes in-process
+    """
+    names, known_matrix = pack_known_encodings(known_people)
+    checkpoint_records = None
+    if on_checkpoint:
+        def checkpoint_records(t, records):
+            on_checkpoint(t, match_video_records(records, names, known_matrix))
+
+    records = load_video_faces(video_path, cache, settings, stats, control, on_progress,
+                               start_time, checkpoint_records, pipeline_workers)
+    with stage_timer(stats, "match"):
+        hits = match_video_records(records, names, known_matrix)
+    count(stats, "matches", sum(len(person_hits) for person_hits in hits.values()))
+    return hits
+
+
+def find_person_segments(video_path, known_people, settings=None, coarse_step=None, min_step=None, stats=None,
+                         control=None, on_progress=None):
+    """
+    Returns { name: [(start, end), ...] } appearance segments of
+    known_people in video_path; see find_person_segment_hits.
+    """
+    hits = find_person_segment_hits(video_path, known_people, settings, coarse_step, min_step, stats,
+                                    control, on_progress)
+    return {name: [(start, end) for start, end, _ in person_hits] for name, person_hits in hits.items()}
+
+
+def find_person_segment_hits(video_path, known_people, settings=None, coarse_step=None, min_step=None, stats=None,
+                             control=None, on_progress=None):
+    """
+    Adaptive coarse-to-fine scan of video_path for known_people.
+
+    Frames are first sampled every coarse_step seconds (by default
+    settings["frame_interval"] * ADAPTIVE_COARSE_FACTOR). Wherever two
+    neighbouring samples disagree (a person appears or leaves, or faces
+    appear at all), the gap is bisected until it is at most min_step
+    seconds wide (by default ADAPTIVE_MIN_STEP, or frame_interval if that
+    is finer), so boundaries are located precisely while long stretches
+    without changes cost one detection per coarse_step. An appearance
+    shorter than coarse_step can fall between two coarse samples and be
+    missed; a fixed-interval scan only misses those shorter than
+    frame_interval.
+
+    Returns { name: [(start, end, confidence), ...] } where each segment
+    runs from the first to the last sample the person was seen on, with the
+    best match_confidence among those samples. If stats is a dict,
+    "detector_calls" is incremented by the number of frames examined, and
+    the same counters and stage timers as a fixed-interval scan are kept.
+    The face cache is not used, since the probed timestamps depend on who
+    is being searched for, and neither is the FrameGate, since probes are
+    not in time order. control and on_progress work as in iter_video_faces;
+    progress covers the coarse pass.
+    """
+    import face_recognition
+    from moviepy import VideoFileClip
+
+    if settings is None:
+        settings = detector_settings()
+    interval = settings["frame_interval"]
+    coarse_step = interval * ADAPTIVE_COARSE_FACTOR if coarse_step is None else coarse_step
+    min_step = min(ADAPTIVE_MIN_STEP, interval) if min_step is None else min_step
+    names, known_matrix = pack_known_encodings(known_people)
+    rows = person_rows(names)
+    states = {}  # t -> (frozenset of person indices, any face detected)
+    confidences = {}  # t -> {person index: best match confidence}
+    scale = None
+
+    def examine(t, frame):
+        nonlocal scale
+        if control is not None:
+            control.checkpoint()
+        if scale is None:
+            scale = resolve_detection_scale(settings["detection_scale"], frame.shape)
+        with stage_timer(stats, "detect"):
+            face_locations = detect_faces(frame, scale, settings["model"], settings["upsample"])
+        with stage_timer(stats, "encode"):
             frame_encodings = face_recognition.face_encodings(frame, face_locations)
-            matched_names_this_frame = set()
-            for face_enc in frame_encodings:
-                for name, known_enc, _ in known_people:
-                    if name in matched_names_this_frame:
-                        continue
-                    if face_recognition.compare_faces([known_enc], face_enc, tolerance=TOLERANCE)[0]:
-                        results[name].append(round(t, 2))
-                        matched_names_this_frame.add(name)
-        clip.reader.close()
-        if clip.audio:
-            clip.audio.reader.close_proc()
+        with stage_timer(stats, "match"):
+            matched, distances = match_encodings(frame_encodings, known_matrix, return_distances=True)
+            matched = np.where(matched >= 0, rows[np.maximum(matched, 0)], -1)
+        states[round(t, 3)] = (frozenset(matched[matched >= 0].tolist()), bool(face_locations))
+        best = confidences[round(t, 3)] = {}
+        for idx, distance in zip(matched.tolist(), distances.tolist()):
+            if idx >= 0:
+                best[idx] = max(best.get(idx, 0.0), match_confidence(distance))
+        count(stats, "samples")
+        count(stats, "detector_calls")
+        count(stats, "faces_detected", len(face_locations))
+        count(stats, "faces_encoded", len(face_locations))
+
+    try:
+        probe = probe_video(video_path)
+        frames_total = int(np.ceil(probe[2] / coarse_step))
+        started = time.perf_counter()
+        coarse = timed(iter_sampled_frames(video_path, coarse_step, probe=probe, buffers=1), stats, "decode")
+        for frames_done, (t, frame) in enumerate(coarse, start=1):
+            examine(t, frame)
+            if on_progress:
+                on_progress(frames_done, frames_total, frames_done / max(time.perf_counter() - started, 1e-6))
+
+        # Random access for the refinement probes; each round probes in time
+        # order so the reader mostly moves forward
+        clip = VideoFileClip(video_path, audio=False)
+        try:
+            end_t = clip.duration - min_step
+            if states and end_t > max(states) + min_step:
+                with stage_timer(stats, "decode"):
+                    frame = clip.get_frame(end_t)
+                examine(end_t, frame)
+            while True:
+                times = sorted(states)
+                pending = [
+                    (a + b) / 2 for a, b in zip(times, times[1:])
+                    if b - a > min_step and states[a] != states[b]
+                ]
+                if not pending:
+                    break
+                for t in pending:
+                    with stage_timer(stats, "decode"):
+                        frame = clip.get_frame(t)
+                    examine(t, frame)
+        finally:
+            clip.close()
+    except ScanCancelled:
+        raise
     except Exception as e:
         print(f"Error processing {video_path}: {e}")
+        count(stats, "errors")
+
+    segments = {name: [] for name in names}
+    for idx, name in enumerate(names):
+        if rows[idx] != idx:
+            continue  # further reference encodings of a person already handled
+        start = last = None
+        confidence = 0.0
+        for t in sorted(states):
+            if idx in states[t][0]:
+                if start is None:
+                    start, confidence = t, 0.0
+                last = t
+                confidence = max(confidence, confidences[t][idx])
+            elif start is not None:
+                segments[name].append((round(start, 2), round(last, 2), confidence))
+                start = None
+        if start is not None:
+            segments[name].append((round(start, 2), round(last, 2), confidence))
+    count(stats, "matches", sum(len(person_segments) for person_segments in segments.values()))
+    return segments
+
+
+def _init_worker(known_people, cache_dir, settings, adaptive, control, events, pipeline_workers):
+    _worker.update(
+        known_people=known_people,
+        cache=FaceCache(cache_dir) if cache_dir else None,
+        settings=settings,
+        adaptive=adaptive,
+        control=control,
+        events=events,
+        pipeline_workers=pipeline_workers,
+    )
+
+
+def _scan_video(video_path, known_people, cache, settings, adaptive, control=None, on_progress=None,
+                start_time=0.0, on_checkpoint=None, pipeline_workers=None):
+    stats = {}
+    started = time.perf_counter()
+    with peak_memory(stats):
+        if adaptive:
+            results = find_person_segment_hits(video_path, known_people, settings, stats=stats,
+                                               control=control, on_progress=on_progress)
+        else:
+            results = find_person_hits(video_path, known_people, cache, settings, stats,
+                                       control=control, on_progress=on_progress,
+                                       start_time=start_time, on_checkpoint=on_checkpoint,
+                                       pipeline_workers=pipeline_workers)
+    count(stats, "video_seconds", time.perf_counter() - started)
+    return results, stats
+
+
+def _scan_video_worker(video_path, start_time):
+    events = _worker["events"]
+    on_progress = on_checkpoint = None
+    if events is not None:
+        def on_progress(frames_done, frames_total, fps):
+            events.put(("frames", video_path, frames_done, frames_total, fps))
+
+        def on_checkpoint(t, partial_results):
+            events.put(("checkpoint", video_path, t, partial_results))
 
-    for name in results:
-        results[name] = sorted(set(results[name]))
+    return _scan_video(video_path, _worker["known_people"], _worker["cache"], _worker["settings"],
+                       _worker["adaptive"], _worker["control"], on_progress, start_time, on_checkpoint,
+                       _worker["pipeline_workers"])
+
+
+def scan_videos(known_people, video_paths, num_workers=None, progress_callback=None, cache_dir=None,
+                settings=None, adaptive=False, stats=None, frame_callback=None, control=None,
+                start_times=None, checkpoint_callback=None, result_callback=None, metrics=None):
+    """
+    Runs find_person_hits (or find_person_segment_hits when adaptive is
+    True) over video_paths, using a pool of num_workers
+    processes when num_workers > 1. Face records are read from and saved to
+    the FaceCache in cache_dir when one is given, and settings (from
+    detector_settings()) applies to every video. If stats is a dict, the
+    per-video counters are summed into it, and a RunMetrics passed as
+    metrics receives each video's own counters. start_times may map video
+    paths to the timestamp their scan should resume from. When there are
+    at least twice as many workers as videos, each video gets one process
+    and is pipelined across num_workers // len(video_paths) more (see
+    iter_video_faces_pipelined; non-adaptive scans only), so a few long
+    videos still use every core.
+
+    Returns the per-video results in the same order as video_paths. If
+    progress_callback is provided, it is called as each video finishes
+    (in completion order) as:
+        progress_callback(finished_count, total_videos, video_path)
+    The optional callbacks below are always called from the calling thread:
+        frame_callback(video_path, frames_done, frames_total, frames_per_second)
+        checkpoint_callback(video_path, t, partial_results)
+        result_callback(video_path, results, video_stats)
+    where video_stats holds the video's own counters ("errors" is set when
+    it failed part-way). A ScanControl passed as control can pause the
+    scan or cancel it, in which case ScanCancelled is raised.
+    """
+    if num_workers is None:
+        num_workers = NUM_WORKERS
+    start_times = start_times or {}
+    total = len(video_paths)
+    results = [None] * total
+    # Workers beyond one per video split each video's frames instead
+    pipeline_workers = num_workers // total if total and num_workers // total > 1 else None
+
+    def video_done(idx, finished, video_results, video_stats):
+        results[idx] = video_results
+        merge_stats(stats, video_stats)
+        if metrics is not None:
+            metrics.add_video(video_paths[idx], video_stats)
+        if result_callback:
+            result_callback(video_paths[idx], video_results, video_stats)
+        if progress_callback:
+            progress_callback(finished, total, video_paths[idx])
+
+    if num_workers <= 1 or total <= 1:
+        cache = FaceCache(cache_dir) if cache_dir else None
+        for idx, video_path in enumerate(video_paths):
+            on_progress = on_checkpoint = None
+            if frame_callback:
+                on_progress = functools.partial(frame_callback, video_path)
+            if checkpoint_callback:
+                on_checkpoint = functools.partial(checkpoint_callback, video_path)
+            video_results, video_stats = _scan_video(video_path, known_people, cache, settings, adaptive, control,
+                                                     on_progress, start_times.get(video_path, 0.0), on_checkpoint,
+                                                     pipeline_workers)
+            video_done(idx, idx + 1, video_results, video_stats)
+        return results
+
+    # Workers report frame progress and checkpoints over a queue that is drained here.
+    # Results come back on the pool's own queue, so events of a video can arrive after
+    # its result; a late checkpoint must not overwrite the finished video's results.
+    events = multiprocessing.Queue() if frame_callback or checkpoint_callback else None
+    finished_paths = set()
+
+    def drain_events():
+        while events is not None:
+            try:
+                kind, *event = events.get_nowait()
+            except queue.Empty:
+                return
+            if event[0] in finished_paths:
+                continue
+            if kind == "frames" and frame_callback:
+                frame_callback(*event)
+            elif kind == "checkpoint" and checkpoint_callback:
+                checkpoint_callback(*event)
+
+    with worker_pool(min(num_workers, total), _init_worker,
+                     (known_people, cache_dir, settings, adaptive, control, events, pipeline_workers),
+                     control) as pool:
+        futures = {
+            pool.submit(_scan_video_worker, path, start_times.get(path, 0.0)): idx
+            for idx, path in enumerate(video_paths)
+        }
+        pending = set(futures)
+        finished = 0
+        while pending:
+            done, pending = wait(pending, timeout=EVENT_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            drain_events()
+            for future in done:
+                finished += 1
+                finished_paths.add(video_paths[futures[future]])
+                video_done(futures[future], finished, *future.result())
     return results
 
 
-def scan_and_save_all(known_people, video_dir, output_dir, progress_callback=None):
+def triage_video(video_path, known_people, settings=None, min_gap=None, stats=None, control=None):
     """
-    Scans videos for known people and saves merged timestamp results.
+    Fast presence check for known_people in video_path: returns
+    { name: (t, confidence) } for each person seen, with the first keyframe
+    they were seen on.
 
-    If progress_callback is provided, it will be called as:
-        progress_callback(current_index, total_videos, current_video_name)
+    Only keyframes are decoded, at most one per min_gap seconds (see
+    iter_keyframes), and decoding stops as soon as everyone in
+    known_people has been seen. Keyframe spacing depends on the encoder,
+    so a person on screen only between keyframes can be missed; triage is
+    for deciding which videos deserve a full scan. settings supplies the
+    detection scale, model and upsampling; stats and control work as in
+    iter_video_faces.
     """
-    video_files = [f for f in os.listdir(video_dir) if f.lower().endswith(".mp4")]
-    total_videos = len(video_files)
-    all_results = {name: {} for name, _, _ in known_people}
+    import face_recognition
+
+    if settings is None:
+        settings = detector_settings()
+    min_gap = TRIAGE_MIN_GAP if min_gap is None else min_gap
+    names, known_matrix = pack_known_encodings(known_people)
+    rows = person_rows(names)
+    wanted = set(rows.tolist())
+    found = {}
+    scale = None
+    keyframes = timed(iter_keyframes(video_path, min_gap, buffers=1), stats, "decode")
+    try:
+        for t, frame in keyframes:
+            if control is not None:
+                control.checkpoint()
+            count(stats, "samples")
+            if scale is None:
+                scale = resolve_detection_scale(settings["detection_scale"], frame.shape)
+            with stage_timer(stats, "detect"):
+                face_locations = detect_faces(frame, scale, settings["model"], settings["upsample"])
+            with stage_timer(stats, "encode"):
+                frame_encodings = face_recognition.face_encodings(frame, face_locations)
+            count(stats, "detector_calls")
+            count(stats, "faces_detected", len(face_locations))
+            count(stats, "faces_encoded", len(face_locations))
+            with stage_timer(stats, "match"):
+                matched, distances = match_encodings(frame_encodings, known_matrix, return_distances=True)
+            for idx, distance in zip(matched.tolist(), distances.tolist()):
+                if idx >= 0 and rows[idx] not in found:
+                    found[rows[idx]] = (round(t, 2), match_confidence(distance))
+            if len(found) == len(wanted):
+                break
+    except ScanCancelled:
+        raise
+    except Exception as e:
+        print(f"Error triaging {video_path}: {e}")
+        count(stats, "errors")
+    finally:
+        keyframes.close()
+    count(stats, "matches", len(found))
+    return {names[idx]: found[idx] for idx in sorted(found)}
+
 
-    for idx, filename in enumerate(video_files, start=1):
-        video_path = os.path.join(video_dir, filename)
-        video_results = find_person_timestamps_multi(video_path, known_people)
-        for name, timestamps in video_results.items():
-            if timestamps:
-                if filename not in all_results[name]:
-                    all_results[name][filename] = []
-                all_results[name][filename].extend(timestamps)
+def _init_triage_worker(known_people, settings, min_gap, control):
+    _worker.update(known_people=known_people, settings=settings, min_gap=min_gap, control=control)
 
+
+def _triage_video(video_path, known_people, settings, min_gap, control=None):
+    stats = {}
+    started = time.perf_counter()
+    with peak_memory(stats):
+        presence = triage_video(video_path, known_people, settings, min_gap, stats, control)
+    count(stats, "video_seconds", time.perf_counter() - started)
+    return presence, stats
+
+
+def _triage_video_worker(video_path):
+    return _triage_video(video_path, _worker["known_people"], _worker["settings"], _worker["min_gap"],
+                         _worker["control"])
+
+
+def triage_videos(known_people, video_paths, num_workers=None, progress_callback=None, settings=None,
+                  min_gap=None, stats=None, control=None):
+    """
+    Runs triage_video over video_paths, on a pool of num_workers processes
+    when num_workers > 1, and returns { video_path: { name: (t, confidence) } }.
+    progress_callback, stats and control work as in scan_videos.
+    """
+    if num_workers is None:
+        num_workers = NUM_WORKERS
+    total = len(video_paths)
+    results = {}
+
+    def video_done(video_path, presence, video_stats):
+        results[video_path] = presence
+        merge_stats(stats, video_stats)
         if progress_callback:
-            progress_callback(idx, total_videos, filename)
+            progress_callback(len(results), total, video_path)
+
+    if num_workers <= 1 or total <= 1:
+        for video_path in video_paths:
+            video_done(video_path, *_triage_video(video_path, known_people, settings, min_gap, control))
+    else:
+        with worker_pool(min(num_workers, total), _init_triage_worker,
+                         (known_people, settings, min_gap, control), control) as pool:
+            futures = {pool.submit(_triage_video_worker, path): path for path in video_paths}
+            for future in as_completed(futures):
+                video_done(futures[future], *future.result())
+    return {video_path: results[video_path] for video_path in video_paths}
+
+
+def flagged_videos(triage_results, names=None):
+    """
+    Returns the videos of a triage_videos result in which anyone (or anyone
+    in names) was seen, for a follow-up full scan.
+    """
+    return [video_path for video_path, presence in triage_results.items()
+            if any(names is None or name in names for name in presence)]
+
+
+def merge_hits(*hit_lists):
+    """
+    Merges (start, end, confidence) hit lists into one list sorted by time,
+    keeping the highest confidence of hits that cover the same span.
+    """
+    best = {}
+    for hits in hit_lists:
+        for start, end, confidence in hits:
+            if confidence > best.get((start, end), -1.0):
+                best[(start, end)] = confidence
+    return [(start, end, confidence) for (start, end), confidence in sorted(best.items())]
+
+
+def hits_to_rows(video, video_results):
+    """
+    Turns one video's { name: [(start, end, confidence)] } results into
+    ResultsStore rows.
+    """
+    return [
+        (name, video, start, end, confidence)
+        for name, hits in video_results.items()
+        for start, end, confidence in hits
+    ]
+
+
+def list_videos(video_dir):
+    """
+    Returns the sorted paths of the .mp4 files in video_dir.
+    """
+    return [os.path.join(video_dir, f) for f in sorted(os.listdir(video_dir)) if f.lower().endswith(".mp4")]
+
+
+def check_distinct_names(video_paths):
+    """
+    Raises ValueError if two of video_paths share a file name. Results,
+    the manifest and the cache sidecars are keyed by file name, so such
+    videos would overwrite each other's results.
+    """
+    seen = {}
+    for path in video_paths:
+        other = seen.setdefault(os.path.basename(path), path)
+        if other != path:
+            raise ValueError(f"Videos need distinct file names: {other} and {path}")
+
+
+def scan_and_save_all(known_people, video_dir, output_dir, progress_callback=None, num_workers=None,
+                      use_cache=True, cache_dir=None, detection_scale=None, adaptive=False,
+                      gate_threshold=None, stats=None, frame_callback=None, control=None, resume=True,
+                      report=True, prometheus_path=None, video_paths=None, frame_interval=None):
+    """
+    Scans videos for known people and saves the results to the
+    ResultsStore in output_dir (RESULTS_DB_FILENAME), one row per
+    appearance with its confidence. Each scanned person's rows for the
+    videos in video_dir are replaced; other rows are kept. The store is
+    then exported to the "{name}_videos.txt" files, whose paths are
+    returned. Text results from before the store existed are imported into
+    it the first time. With adaptive=True, videos are scanned
+    coarse-to-fine and results are saved as appearance segments
+    ("MM:SS-MM:SS") instead of sample times.
+
+    The .mp4 files in video_dir are scanned, or video_paths when given
+    (video_dir is then ignored). Results are keyed by file name, so the
+    videos must have distinct names (see check_distinct_names).
+    frame_interval overrides FRAME_INTERVAL, the seconds between samples.
+    Videos are scanned by num_workers processes (defaults to NUM_WORKERS).
+    detection_scale ("auto" or a factor in (0, 1], defaults to
+    DETECTION_SCALE) shrinks frames for face detection only; encodings are
+    still computed at full resolution.
+    Detected faces are cached per video in cache_dir (defaults to
+    output_dir/CACHE_DIRNAME), so adding a person later only re-runs the
+    matching step; pass use_cache=False to always decode.
+    gate_threshold (defaults to GATE_THRESHOLD, 0 disables) controls how
+    little a sample may differ from the last detected one before its
+    detection is reused. Pass a dict as stats to receive the summed
+    counters ("samples", "detector_calls", "gated_samples", "faces_detected",
+    "matches", "errors", "cache_hits", "videos_skipped", ...) and stage
+    timers ("decode_seconds", "detect_seconds", ...).
+
+    Unless report=False, a run report with those totals, the stage times
+    and one summary per scanned video is written to
+    output_dir/REPORT_FILENAME when the scan ends, even if it was cancelled
+    or failed. prometheus_path, if given, also receives the totals as a
+    Prometheus textfile.
+
+    Progress is recorded per video in a ScanManifest in output_dir as soon
+    as each video finishes, and periodically while it is scanned. With
+    resume=True, a rerun for the same people and settings skips videos that
+    are complete and unchanged, and continues interrupted videos from their
+    last checkpoint (adaptive scans restart unfinished videos). A video
+    that could not be opened or failed part-way is saved with what was
+    found but recorded as failed, and scanned again from the start by the
+    next run.
+
+    If progress_callback is provided, it will be called as each video finishes:
+        progress_callback(finished_count, total_videos, video_name)
+    and frame_callback, if provided, as frames are processed:
+        frame_callback(video_name, frames_done, frames_total, frames_per_second)
+    Both are called from the thread running the scan. A ScanControl passed
+    as control can pause or cancel the scan; cancelling raises
+    ScanCancelled, and only the manifest keeps the progress made so far.
+    """
+    if stats is None:
+        stats = {}
+    if video_paths is None:
+        video_paths = list_videos(video_dir)
+    check_distinct_names(video_paths)
+    video_files = [os.path.basename(path) for path in video_paths]
+    settings = detector_settings(frame_interval, detection_scale, gate_threshold)
 
     os.makedirs(output_dir, exist_ok=True)
+    manifest = ScanManifest(output_dir, scan_key(known_people, settings, adaptive))
+    if not resume:
+        manifest.videos = {}
+    done_paths = [path for path in video_paths if manifest.is_done(path)]
+    to_scan = [path for path in video_paths if not manifest.is_done(path)]
+    count(stats, "videos_skipped", len(done_paths))
+    start_times = {}
+    if not adaptive:
+        for path in to_scan:
+            resume_t = manifest.resume_time(path)
+            if resume_t is not None:
+                start_times[path] = resume_t + settings["frame_interval"]
 
-    saved_files = []
-    for name in all_results:
-        output_file = os.path.join(output_dir, f"{name}_videos.txt")
-        existing_entries = {}
-        if os.path.exists(output_file):
-            with open(output_file, "r") as f:
-                for line in f:
-                    if ':' in line:
-                        vid, times_str = line.strip().split(":", 1)
-                        existing_entries[vid.strip()] = times_str.strip()
-
-        for video, times in all_results[name].items():
-            formatted_times = [format_timestamp(t) for t in times]
-            times_str = ", ".join(formatted_times)
-            if video in existing_entries:
-                old_times = set(existing_entries[video].split(", "))
-                new_times = set(formatted_times)
-                combined = sorted(old_times.union(new_times))
-                existing_entries[video] = ", ".join(combined)
-            else:
-                existing_entries[video] = times_str
+    def on_video_done(finished, total, video_path):
+        if progress_callback:
+            progress_callback(finished, total, os.path.basename(video_path))
+
+    def on_frames(video_path, frames_done, frames_total, fps):
+        frame_callback(os.path.basename(video_path), frames_done, frames_total, fps)
 
-        with open(output_file, "w") as f:
-            for video, times_str in sorted(existing_entries.items()):
-                f.write(f"{video}: {times_str}\n")
+    def on_checkpoint(video_path, t, partial_results):
+        earlier = manifest.results(video_path)
+        merged = {name: merge_hits(earlier.get(name, []), hits) for name, hits in partial_results.items()}
+        manifest.checkpoint(video_path, t, merged)
+
+    def on_result(video_path, video_results, video_stats):
+        # Results found before an interruption are folded in when resuming
+        earlier = manifest.results(video_path) if video_path in start_times else {}
+        merged = {name: merge_hits(earlier.get(name, []), hits) for name, hits in video_results.items()}
+        if video_stats.get("errors"):
+            manifest.fail(video_path, merged)
+        else:
+            manifest.complete(video_path, merged)
+
+    if use_cache and cache_dir is None:
+        cache_dir = os.path.join(output_dir, CACHE_DIRNAME)
+    metrics = RunMetrics(settings)
+    status = "failed"
+    try:
+        scan_videos(known_people, to_scan, num_workers, on_video_done,
+                    cache_dir=cache_dir if use_cache else None, settings=settings, adaptive=adaptive,
+                    stats=stats, frame_callback=on_frames if frame_callback else None, control=control,
+                    start_times=start_times, checkpoint_callback=None if adaptive else on_checkpoint,
+                    result_callback=on_result, metrics=metrics)
 
-        saved_files.append(output_file)
+        rows = []
+        for filename, video_path in zip(video_files, video_paths):
+            rows.extend(hits_to_rows(filename, manifest.results(video_path)))
 
+        names = list(dict.fromkeys(person[0] for person in known_people))
+        with stage_timer(stats, "write"):
+            with ResultsStore(os.path.join(output_dir, RESULTS_DB_FILENAME)) as store:
+                if store.is_new:
+                    store.import_text(output_dir)
+                store.replace(names, video_files, rows)
+                saved_files = store.export_text(output_dir, names)
+        status = "completed"
+    except ScanCancelled:
+        status = "cancelled"
+        raise
+    finally:
+        metrics.finish(status)
+        if report:
+            metrics.write_json(os.path.join(output_dir, REPORT_FILENAME), stats)
+        if prometheus_path:
+            metrics.write_prometheus(prometheus_path, stats)
     return saved_files
@@ -0,0 +1,704 @@
+# face_sorter_bench.py
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import face_recognition
+from moviepy import VideoClip, VideoFileClip
+from PIL import Image, ImageDraw, ImageFilter
+from face_sorter_backend import (
+    FRAME_INTERVAL, TOLERANCE, FaceTracker, pack_known_encodings, match_encodings, match_video_records,
+    resolve_detection_scale, detect_faces, detector_settings, hits_to_rows, load_video_faces, vote_by_track,
+)
+from face_sorter_gallery import IMAGE_EXTENSIONS, encode_reference_image
+from face_sorter_metrics import STAGES, peak_rss_bytes, stage_timer
+from face_sorter_models import HEAVY_MODULES
+from face_sorter_store import ResultsStore
+from face_sorter_video import iter_sampled_frames
+
+# (name, (width, height), duration in seconds) of the synthetic suite videos
+SUITE_CASES = [
+    ("360p-60s", (640, 360), 60),
+    ("720p-60s", (1280, 720), 60),
+    ("1080p-30s", (1920, 1080), 30),
+]
+SUITE_SEGMENT = 5.0        # seconds each face (or an empty stretch) stays on screen
+SUITE_FACES = 6            # generated faces composited into the suite videos
+SUITE_FACE_SIZE = 256
+SUITE_FACE_TRIES = 200     # seeds tried to find SUITE_FACES the detector finds
+SUITE_TOLERANCE = 0.10     # allowed frames/sec drop or peak RSS growth vs the baseline
+STARTUP_MODULES = ("face_sorter_app", "face_sorter_cli", "group_faces")
+STARTUP_BUDGET = 0.5       # seconds a cold import of a front end may take
+STARTUP_RUNS = 5
+
+
+def _random_encodings(rng, count):
+    # face_recognition encodings are 128-d with pairwise distances around 0.4-1.0
+    return rng.normal(0.0, 0.06, size=(count, 128))
+
+
+def _loop_match(frame_encodings, known_people):
+    """
+    The original per-face, per-person compare_faces loop, kept for comparison.
+    """
+    matched = set()
+    for face_enc in frame_encodings:
+        for name, known_enc, _ in known_people:
+            if name in matched:
+                continue
+            if face_recognition.compare_faces([known_enc], face_enc, tolerance=TOLERANCE)[0]:
+                matched.add(name)
+    return matched
+
+
+def bench_matching(people_counts=(1, 10, 50, 200), faces_per_frame=4, frames=500, seed=0):
+    """
+    Times per-frame matching with the compare_faces loop vs match_encodings
+    as the number of known people grows. Returns a list of result dicts.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for people in people_counts:
+        known_people = [(f"person_{i}", enc, None) for i, enc in enumerate(_random_encodings(rng, people))]
+        frame_batches = [_random_encodings(rng, faces_per_frame) for _ in range(frames)]
+
+        start = time.perf_counter()
+        for encodings in frame_batches:
+            _loop_match(list(encodings), known_people)
+        loop_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        names, known_matrix = pack_known_encodings(known_people)
+        for encodings in frame_batches:
+            match_encodings(encodings, known_matrix)
+        vector_seconds = time.perf_counter() - start
+
+        rows.append({
+            "people": people,
+            "faces_per_frame": faces_per_frame,
+            "frames": frames,
+            "loop_ms_per_frame": 1000 * loop_seconds / frames,
+            "vector_ms_per_frame": 1000 * vector_seconds / frames,
+            "speedup": loop_seconds / vector_seconds if vector_seconds else float("inf"),
+        })
+    return rows
+
+
+def check_match_encodings():
+    """
+    Edge cases of match_encodings that real frames hit: a frame with no
+    faces, a frame with a single face, and an empty gallery. Returns a list
+    of failure messages.
+    """
+    failures = []
+    rng = np.random.default_rng(0)
+    known_matrix = _random_encodings(rng, 3)
+
+    for label, faces in (("no faces (list)", []), ("no faces (array)", np.empty((0, 128)))):
+        try:
+            matched, distances = match_encodings(faces, known_matrix, return_distances=True)
+            if matched.shape != (0,) or distances.shape != (0,):
+                failures.append(f"{label}: expected empty results, got shapes {matched.shape}, {distances.shape}")
+        except Exception as e:
+            failures.append(f"{label}: raised {e!r}")
+
+    face = known_matrix[1] + 0.001
+    for label, faces in (("one face (list)", [face]), ("one face (2-D array)", face[None, :])):
+        try:
+            matched = match_encodings(faces, known_matrix)
+            if matched.tolist() != [1]:
+                failures.append(f"{label}: expected [1], got {matched.tolist()}")
+        except Exception as e:
+            failures.append(f"{label}: raised {e!r}")
+
+    try:
+        matched = match_encodings([face], np.empty((0, 128)))
+        if matched.tolist() != [-1]:
+            failures.append(f"empty gallery: expected [-1], got {matched.tolist()}")
+    except Exception as e:
+        failures.append(f"empty gallery: raised {e!r}")
+    return failures
+
+
+def check_sampled_frames(intervals=(1.0, 2.0, 3.3), start_time=4.0, max_diff=2.0):
+    """
+    Compares the frames iter_sampled_frames yields with clip.get_frame(t)
+    for the same timestamps, on a short synthetic clip whose pixels change
+    every frame, so a sample off by even one frame shows up as a mean pixel
+    difference well above max_diff.
+    """
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        video = make_synthetic_clip(os.path.join(tmp, "sampling.mp4"), duration=12, size=(320, 180), gop=60)
+        clip = VideoFileClip(video, audio=False)
+        try:
+            for interval in intervals:
+                for start in (0.0, start_time):
+                    expected = np.arange(start, clip.duration, interval)
+                    samples = list(iter_sampled_frames(video, interval, start))
+                    if len(samples) != len(expected):
+                        failures.append(f"interval {interval} from {start}s: {len(samples)} samples, "
+                                        f"expected {len(expected)}")
+                    for (t, frame), want_t in zip(samples, expected):
+                        diff = np.mean(np.abs(frame.astype(np.int16) - clip.get_frame(t).astype(np.int16)))
+                        if abs(t - want_t) > 1e-6 or diff > max_diff:
+                            failures.append(f"interval {interval} from {start}s: sample at {t:.2f}s differs "
+                                            f"from get_frame by {diff:.1f} on average")
+                            break
+        finally:
+            clip.close()
+    return failures
+
+
+def check_face_tracker(samples=8, switch_at=5):
+    """
+    Two people filmed in the same framing, one after the other: the face
+    box never moves, person A is on screen for the first switch_at samples
+    and person B after that. Votes per track must still give each sample
+    its own person, both when the tracker is told about the cut and when
+    only a re-encode can notice it.
+    """
+    failures = []
+    rng = np.random.default_rng(0)
+    known_matrix = _random_encodings(rng, 2)
+    box = (100, 200, 200, 100)
+    expected = [0] * switch_at + [1] * (samples - switch_at)
+    for label, cut_known in (("with a scene cut", True), ("without a scene cut", False)):
+        tracker = FaceTracker(reencode_every=switch_at)
+        encodings, track_ids = [], []
+        for idx in range(samples):
+            ids, to_encode = tracker.assign([box], cut=cut_known and idx == switch_at)
+            fresh = [known_matrix[expected[idx]]] * len(to_encode)
+            encodings += tracker.resolve(ids, to_encode, fresh)
+            track_ids += ids
+        voted = vote_by_track(match_encodings(encodings, known_matrix), track_ids)
+        if voted.tolist() != expected:
+            failures.append(f"{label}: identities {voted.tolist()}, expected {expected}")
+    return failures
+
+
+# name -> function returning failure messages, run by the "check" command
+CHECKS = {
+    "match-encodings": check_match_encodings,
+    "sampled-frames": check_sampled_frames,
+    "face-tracker": check_face_tracker,
+}
+
+
+def run_checks(names=None):
+    """
+    Runs the CHECKS named in names (default: all) and returns
+    { name: [failure messages] }.
+    """
+    return {name: CHECKS[name]() for name in (names or list(CHECKS))}
+
+
+def make_synthetic_clip(path, duration=120, size=(1280, 720), fps=30, gop=300):
+    """
+    Writes a synthetic moving-gradient clip encoded with a long GOP (one
+    keyframe every `gop` frames), which is where seeking hurts most.
+    """
+    width, height = size
+    xs = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    ys = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+
+    def make_frame(t):
+        r = (xs + 40 * t) % 256 + 0 * ys
+        g = (ys + 25 * t) % 256 + 0 * xs
+        b = (r + g) / 2
+        return np.stack([r, g, b], axis=-1).astype(np.uint8)
+
+    VideoClip(make_frame, duration=duration).write_videofile(
+        path, fps=fps, codec="libx264", audio=False, logger=None,
+        ffmpeg_params=["-g", str(gop), "-keyint_min", str(gop)],
+    )
+    return path
+
+
+def bench_decoding(video_path, interval=FRAME_INTERVAL):
+    """
+    Times per-timestamp clip.get_frame(t) sampling vs the single-pass
+    iter_sampled_frames decoder over the same timestamps.
+    """
+    start = time.perf_counter()
+    clip = VideoFileClip(video_path, audio=False)
+    seek_frames = 0
+    for t in np.arange(0, clip.duration, interval):
+        clip.get_frame(t)
+        seek_frames += 1
+    clip.close()
+    seek_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stream_frames = sum(1 for _ in iter_sampled_frames(video_path, interval, buffers=1))
+    stream_seconds = time.perf_counter() - start
+
+    return {
+        "video": os.path.basename(video_path),
+        "interval": interval,
+        "seek_frames": seek_frames,
+        "seek_seconds": seek_seconds,
+        "stream_frames": stream_frames,
+        "stream_seconds": stream_seconds,
+        "speedup": seek_seconds / stream_seconds if stream_seconds else float("inf"),
+    }
+
+
+def find_face_images(faces_dir):
+    """
+    Returns sorted image paths under faces_dir (e.g. a gallery), searched recursively.
+    """
+    paths = []
+    for root, _, files in os.walk(faces_dir):
+        paths.extend(os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def make_synthetic_face(seed, size=SUITE_FACE_SIZE):
+    """
+    Draws a flat cartoon face (skin, hair, brows, eyes, nose, mouth) whose
+    colours and proportions are drawn from seed, so the same seed always
+    gives the same image.
+    """
+    rng = np.random.default_rng(seed)
+    s = size / 256
+    skin = tuple(int(min(255, value)) for value in np.array([225, 180, 150]) * rng.uniform(0.5, 1.05))
+    shade = tuple(int(value * 0.72) for value in skin)
+    hair = tuple(int(value) for value in rng.integers(15, 80, 3))
+    image = Image.new("RGB", (size, size), tuple(int(value) for value in rng.integers(120, 220, 3)))
+    draw = ImageDraw.Draw(image)
+    cx, cy = 128 * s, 140 * s
+    fw, fh = rng.uniform(72, 82) * s, rng.uniform(95, 105) * s
+
+    draw.rectangle([cx - fw * 0.45, cy + fh * 0.6, cx + fw * 0.45, size], fill=skin)  # neck
+    for side in (-1, 1):
+        draw.ellipse([cx + side * fw - 12 * s, cy - 18 * s, cx + side * fw + 12 * s, cy + 22 * s], fill=skin)
+    draw.ellipse([cx - fw, cy - fh, cx + fw, cy + fh], fill=skin)
+    draw.chord([cx - fw - 4 * s, cy - fh - 8 * s, cx + fw + 4 * s, cy - fh * 0.1], 180, 360, fill=hair)
+
+    eye_y = cy - fh * rng.uniform(0.08, 0.16)
+    eye_dx = fw * rng.uniform(0.40, 0.46)
+    for side in (-1, 1):
+        ex = cx + side * eye_dx
+        draw.ellipse([ex - 22 * s, eye_y - 14 * s, ex + 22 * s, eye_y + 12 * s], fill=shade)
+        draw.line([ex - 22 * s, eye_y - 24 * s, ex + 22 * s, eye_y - 26 * s], fill=hair, width=int(8 * s))
+        draw.ellipse([ex - 15 * s, eye_y - 6 * s, ex + 15 * s, eye_y + 6 * s], fill=(235, 235, 230))
+        draw.ellipse([ex - 6 * s, eye_y - 6 * s, ex + 6 * s, eye_y + 6 * s], fill=(35, 25, 20))
+
+    nose_y = cy + fh * rng.uniform(0.22, 0.28)
+    draw.line([cx - 4 * s, eye_y, cx - 8 * s, nose_y], fill=shade, width=int(5 * s))
+    draw.ellipse([cx - 16 * s, nose_y - 6 * s, cx + 16 * s, nose_y + 8 * s], fill=shade)
+    for side in (-1, 1):
+        nx = cx + side * 8 * s
+        draw.ellipse([nx - 4 * s, nose_y - 2 * s, nx + 4 * s, nose_y + 4 * s], fill=(60, 35, 30))
+
+    mouth_y = cy + fh * rng.uniform(0.5, 0.56)
+    mouth_w = fw * rng.uniform(0.38, 0.46)
+    draw.chord([cx - mouth_w, mouth_y - 10 * s, cx + mouth_w, mouth_y + 10 * s], 0, 180, fill=(160, 70, 70))
+    draw.line([cx - mouth_w, mouth_y, cx + mouth_w, mouth_y], fill=(90, 30, 30), width=int(3 * s))
+    return image.filter(ImageFilter.GaussianBlur(1.5 * s))
+
+
+def make_suite_faces(faces_dir, count=SUITE_FACES):
+    """
+    Writes count generated faces to faces_dir (reusing ones already there)
+    and returns their paths. Seeds are tried in order and a face is kept
+    only if the detector finds it, so every machine gets the same set.
+    Face recognition sees these cartoons as much alike, so they suit
+    profiling speed and memory, not matching accuracy.
+    """
+    os.makedirs(faces_dir, exist_ok=True)
+    paths = []
+    for seed in range(SUITE_FACE_TRIES):
+        if len(paths) == count:
+            return paths
+        path = os.path.join(faces_dir, f"face_{seed:03d}.png")
+        if os.path.exists(path):
+            paths.append(path)
+            continue
+        image = make_synthetic_face(seed)
+        if face_recognition.face_locations(np.asarray(image)):
+            image.save(path)
+            paths.append(path)
+    if len(paths) < count:
+        raise ValueError(f"Only {len(paths)} of {count} generated faces were detected")
+    return paths
+
+
+def images_digest(image_paths):
+    """
+    SHA-1 of the contents of image_paths, in order: names a generated
+    clip after the exact faces it was made from.
+    """
+    digest = hashlib.sha1()
+    for image_path in image_paths:
+        with open(image_path, "rb") as f:
+            digest.update(hashlib.sha1(f.read()).digest())
+    return digest.hexdigest()
+
+
+def make_face_clip(path, face_images, size=(1280, 720), duration=60, fps=25, gop=250):
+    """
+    Writes a synthetic clip of face photos composited onto a moving gradient.
+
+    Every SUITE_SEGMENT seconds the next face image slides across the
+    frame, with one empty stretch per cycle, so the clip has faces
+    appearing, moving and leaving. The output only depends on the inputs.
+    """
+    width, height = size
+    xs = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    ys = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    faces = []
+    for image_path in face_images:
+        image = Image.open(image_path).convert("RGB")
+        image.thumbnail((width // 2, int(height * 0.6)))
+        faces.append(np.asarray(image))
+
+    def make_frame(t):
+        r = (xs + 40 * t) % 256 + 0 * ys
+        g = (ys + 25 * t) % 256 + 0 * xs
+        frame = np.stack([r, g, (r + g) / 2], axis=-1).astype(np.uint8)
+        segment = int(t // SUITE_SEGMENT) % (len(faces) + 1)
+        if segment < len(faces):
+            face = faces[segment]
+            progress = (t % SUITE_SEGMENT) / SUITE_SEGMENT
+            left = int((width - face.shape[1]) * progress)
+            top = (height - face.shape[0]) // 2
+            frame[top:top + face.shape[0], left:left + face.shape[1]] = face
+        return frame
+
+    VideoClip(make_frame, duration=duration).write_videofile(
+        path, fps=fps, codec="libx264", audio=False, logger=None,
+        ffmpeg_params=["-g", str(gop), "-keyint_min", str(gop)],
+    )
+    return path
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MiB.
+    """
+    return peak_rss_bytes() / (1024 * 1024)
+
+
+def profile_scan(video_path, known_people, settings=None):
+    """
+    Runs the find_person_timestamps_multi pipeline on video_path (no face
+    cache) and returns the backend's stage timers (decode, gate, detect,
+    encode, match, write) and counts.
+    """
+    stats = {}
+    started = time.perf_counter()
+    records = load_video_faces(video_path, None, settings, stats)
+    names, known_matrix = pack_known_encodings(known_people)
+    with stage_timer(stats, "match"):
+        hits = match_video_records(records, names, known_matrix)
+    with stage_timer(stats, "write"):
+        with tempfile.TemporaryDirectory() as tmp:
+            with ResultsStore(os.path.join(tmp, "results.sqlite3")) as store:
+                video = os.path.basename(video_path)
+                store.replace(list(hits), [video], hits_to_rows(video, hits))
+                store.export_text(tmp, list(hits))
+    seconds = time.perf_counter() - started
+
+    return {
+        "samples": stats.get("samples", 0),
+        "faces": stats.get("faces_detected", 0),
+        "hits": sum(len(person_hits) for person_hits in hits.values()),
+        "seconds": seconds,
+        "frames_per_second": stats.get("samples", 0) / seconds if seconds else 0.0,
+        "stages": {stage: stats.get(f"{stage}_seconds", 0.0) for stage in STAGES},
+    }
+
+
+def _run_suite_case(video_path, known_people, settings):
+    # Runs in a fresh process so peak RSS belongs to this case alone
+    row = profile_scan(video_path, known_people, settings)
+    row["peak_rss_mb"] = peak_rss_mb()
+    return row
+
+
+def run_suite(faces_dir=None, work_dir=None, cases=None, settings=None):
+    """
+    Generates (or reuses, in work_dir) the SUITE_CASES videos and profiles
+    a scan of each one in its own process. Returns a JSON-serializable
+    report.
+
+    The videos show the SUITE_FACES faces of make_suite_faces, so reports
+    from different machines compare like with like, or the face images in
+    faces_dir when given. A generated video is named after a hash of the
+    face images, so different faces never reuse a stale video.
+    """
+    work_dir = work_dir or os.path.join(tempfile.gettempdir(), "face_sorter_bench")
+    if faces_dir is None:
+        face_images = make_suite_faces(os.path.join(work_dir, "faces"))
+    else:
+        face_images = find_face_images(faces_dir)
+    if not face_images:
+        raise ValueError(f"No face images found in {faces_dir}; pass a folder of face photos")
+    known_people = []
+    for image_path in face_images:
+        encoding = encode_reference_image(image_path)
+        if encoding is not None:
+            known_people.append((os.path.splitext(os.path.basename(image_path))[0], encoding, image_path))
+    if settings is None:
+        settings = detector_settings()
+    os.makedirs(work_dir, exist_ok=True)
+    faces_key = images_digest(face_images)[:12]
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "settings": settings,
+        "face_images": len(face_images),
+        "faces_key": faces_key,
+        "cases": [],
+    }
+    context = multiprocessing.get_context("spawn")
+    for name, size, duration in cases or SUITE_CASES:
+        video_path = os.path.join(work_dir, f"{name}-{faces_key}.mp4")
+        if not os.path.exists(video_path):
+            make_face_clip(video_path, face_images, size, duration)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            row = pool.submit(_run_suite_case, video_path, known_people, settings).result()
+        row.update(name=name, width=size[0], height=size[1], duration=duration)
+        report["cases"].append(row)
+    return report
+
+
+def compare_to_baseline(report, baseline, tolerance=SUITE_TOLERANCE):
+    """
+    Returns a list of regression messages: cases whose frames/sec fell, or
+    whose peak RSS grew, by more than tolerance relative to baseline. A
+    baseline made from other face images is reported instead of compared.
+    """
+    if baseline.get("faces_key") != report.get("faces_key"):
+        return [f"baseline was made from other face images ({baseline.get('faces_key')} vs {report.get('faces_key')})"]
+    previous = {case["name"]: case for case in baseline.get("cases", [])}
+    regressions = []
+    for case in report["cases"]:
+        old = previous.get(case["name"])
+        if old is None:
+            continue
+        if case["frames_per_second"] < old["frames_per_second"] * (1 - tolerance):
+            regressions.append(f"{case['name']}: {case['frames_per_second']:.2f} frames/s "
+                               f"vs {old['frames_per_second']:.2f} baseline")
+        if case["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{case['name']}: peak RSS {case['peak_rss_mb']:.0f} MiB "
+                               f"vs {old['peak_rss_mb']:.0f} MiB baseline")
+    return regressions
+
+
+def _fresh_python(code):
+    # Runs code in a new interpreter from the repository folder; returns (wall seconds, stdout, stderr)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    return time.perf_counter() - started, result.stdout, result.stderr
+
+
+def bench_startup(modules=STARTUP_MODULES, runs=STARTUP_RUNS, top=5):
+    """
+    Imports each front-end module in fresh interpreters and reports the
+    median import time, the median wall time of the whole process, the
+    slowest imports (from python -X importtime) and any HEAVY_MODULES that
+    were imported eagerly. Also times a warm_up() in a fresh interpreter,
+    which is what the background warm-up costs.
+    """
+    rows = []
+    for module in modules:
+        code = (
+            "import json, sys, time\n"
+            "started = time.perf_counter()\n"
+            f"import {module}\n"
+            "print(json.dumps({'seconds': time.perf_counter() - started, "
+            f"'eager': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n"
+        )
+        timings = []
+        for _ in range(runs):
+            wall, stdout, stderr = _fresh_python(code)
+            timings.append((json.loads(stdout)["seconds"], wall))
+        slowest = []
+        for line in stderr.splitlines():
+            parts = line.split("|")
+            if line.startswith("import time:") and parts[1].strip().isdigit():
+                slowest.append((int(parts[1]) / 1e6, parts[2].strip()))
+        rows.append({
+            "module": module,
+            "import_seconds": float(np.median([seconds for seconds, _ in timings])),
+            "process_seconds": float(np.median([wall for _, wall in timings])),
+            "eager": json.loads(stdout)["eager"],
+            "slowest": sorted(slowest, reverse=True)[:top],
+        })
+
+    code = "import json\nfrom face_sorter_models import warm_up\nstats = {}\nwarm_up(stats)\nprint(json.dumps(stats))\n"
+    warm_up_seconds = json.loads(_fresh_python(code)[1])["warm_up_seconds"]
+    return rows, warm_up_seconds
+
+
+def bench_detection_scale(video_path, scales=("auto", 1.0, 0.75, 0.5, 0.25), interval=FRAME_INTERVAL,
+                          max_frames=60):
+    """
+    Times detect + full-resolution encode per sampled frame at each detection
+    scale, and measures recall against scale 1.0: the share of full-scale
+    faces that have a face within TOLERANCE on the same frame.
+    """
+    frames = []
+    for t, frame in iter_sampled_frames(video_path, interval, buffers=1):
+        frames.append(frame.copy())
+        if len(frames) >= max_frames:
+            break
+
+    def run(scale):
+        start = time.perf_counter()
+        per_frame = []
+        for frame in frames:
+            locations = detect_faces(frame, resolve_detection_scale(scale, frame.shape))
+            per_frame.append(face_recognition.face_encodings(frame, locations))
+        return per_frame, time.perf_counter() - start
+
+    reference, reference_seconds = run(1.0)
+    reference_faces = sum(len(encs) for encs in reference)
+    rows = []
+    for scale in scales:
+        found, seconds = (reference, reference_seconds) if scale == 1.0 else run(scale)
+        recalled = 0
+        for ref_encs, encs in zip(reference, found):
+            if ref_encs and encs:
+                recalled += int(np.sum(match_encodings(ref_encs, np.asarray(encs)) >= 0))
+        rows.append({
+            "scale": scale,
+            "resolved_scale": resolve_detection_scale(scale, frames[0].shape) if frames else None,
+            "frames": len(frames),
+            "faces": sum(len(encs) for encs in found),
+            "recall": recalled / reference_faces if reference_faces else 1.0,
+            "ms_per_frame": 1000 * seconds / len(frames) if frames else 0.0,
+            "speedup": reference_seconds / seconds if seconds else float("inf"),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face Sorter micro-benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    matching = sub.add_parser("matching", help="compare_faces loop vs vectorized matching")
+    matching.add_argument("--people", type=int, nargs="+", default=[1, 10, 50, 200])
+    matching.add_argument("--faces", type=int, default=4, help="faces per frame")
+    matching.add_argument("--frames", type=int, default=500)
+
+    decoding = sub.add_parser("decoding", help="get_frame seeks vs single-pass sampled decoding")
+    decoding.add_argument("--video", help="video to decode (default: generate a synthetic long-GOP clip)")
+    decoding.add_argument("--interval", type=float, default=FRAME_INTERVAL)
+    decoding.add_argument("--duration", type=float, default=120, help="synthetic clip length in seconds")
+    decoding.add_argument("--gop", type=int, default=300, help="synthetic clip keyframe interval in frames")
+
+    scales = sub.add_parser("detection-scale", help="accuracy/throughput of downscaled detection")
+    scales.add_argument("--video", required=True, help="video with faces to sample")
+    scales.add_argument("--scales", nargs="+", default=["auto", "1.0", "0.75", "0.5", "0.25"])
+    scales.add_argument("--interval", type=float, default=FRAME_INTERVAL)
+    scales.add_argument("--max-frames", type=int, default=60)
+
+    suite = sub.add_parser("suite", help="per-stage scan profile on synthetic face videos, with baseline compare")
+    suite.add_argument("--faces", help="folder of face photos to composite (default: generated faces)")
+    suite.add_argument("--work-dir", help="where generated videos are kept between runs")
+    suite.add_argument("--output", help="write the JSON report here")
+    suite.add_argument("--baseline", help="JSON report to compare against")
+    suite.add_argument("--save-baseline", help="also write the report here as the new baseline")
+    suite.add_argument("--tolerance", type=float, default=SUITE_TOLERANCE)
+
+    startup = sub.add_parser("startup", help="cold import time of the front ends, with a budget check")
+    startup.add_argument("--modules", nargs="+", default=list(STARTUP_MODULES))
+    startup.add_argument("--runs", type=int, default=STARTUP_RUNS)
+    startup.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="seconds allowed per import")
+
+    check = sub.add_parser("check", help="correctness checks of scan building blocks; exits 1 on a failure")
+    check.add_argument("--only", nargs="+", choices=list(CHECKS), help="checks to run (default: all)")
+
+    args = parser.parse_args()
+
+    if args.bench == "matching":
+        print(f"{'people':>8} {'loop ms/frame':>14} {'vector ms/frame':>16} {'speedup':>8}")
+        for row in bench_matching(args.people, args.faces, args.frames):
+            print(f"{row['people']:>8} {row['loop_ms_per_frame']:>14.3f} "
+                  f"{row['vector_ms_per_frame']:>16.3f} {row['speedup']:>7.1f}x")
+
+    elif args.bench == "decoding":
+        with tempfile.TemporaryDirectory() as tmp:
+            video = args.video or make_synthetic_clip(os.path.join(tmp, "synthetic.mp4"), args.duration, gop=args.gop)
+            row = bench_decoding(video, args.interval)
+        print(f"get_frame seeks: {row['seek_frames']} frames in {row['seek_seconds']:.2f}s")
+        print(f"streaming:       {row['stream_frames']} frames in {row['stream_seconds']:.2f}s")
+        print(f"speedup:         {row['speedup']:.1f}x")
+
+    elif args.bench == "detection-scale":
+        scale_values = [s if s == "auto" else float(s) for s in args.scales]
+        print(f"{'scale':>6} {'factor':>7} {'faces':>6} {'recall':>7} {'ms/frame':>9} {'speedup':>8}")
+        for row in bench_detection_scale(args.video, scale_values, args.interval, args.max_frames):
+            print(f"{row['scale']!s:>6} {row['resolved_scale']:>7.3f} {row['faces']:>6} {row['recall']:>7.1%} "
+                  f"{row['ms_per_frame']:>9.1f} {row['speedup']:>7.1f}x")
+
+    elif args.bench == "suite":
+        report = run_suite(args.faces, args.work_dir)
+        print(f"{'case':>10} {'samples':>8} {'frames/s':>9} {'decode':>7} {'gate':>7} {'detect':>7} {'encode':>7} "
+              f"{'match':>7} {'write':>7} {'peak MiB':>9}")
+        for case in report["cases"]:
+            stages = case["stages"]
+            print(f"{case['name']:>10} {case['samples']:>8} {case['frames_per_second']:>9.2f} "
+                  f"{stages['decode']:>7.2f} {stages['gate']:>7.2f} {stages['detect']:>7.2f} {stages['encode']:>7.2f} "
+                  f"{stages['match']:>7.3f} {stages['write']:>7.3f} {case['peak_rss_mb']:>9.0f}")
+        for path in (args.output, args.save_baseline):
+            if path:
+                with open(path, "w") as f:
+                    json.dump(report, f, indent=2)
+        if args.baseline:
+            with open(args.baseline, "r") as f:
+                regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+            for message in regressions:
+                print(f"REGRESSION {message}")
+            if regressions:
+                sys.exit(1)
+            print("No regressions against the baseline.")
+
+    elif args.bench == "startup":
+        rows, warm_up_seconds = bench_startup(args.modules, args.runs)
+        failures = []
+        for row in rows:
+            print(f"{row['module']}: import {row['import_seconds']:.3f}s, process {row['process_seconds']:.3f}s")
+            for seconds, name in row["slowest"]:
+                print(f"    {seconds:7.3f}s  {name}")
+            if row["import_seconds"] > args.budget:
+                failures.append(f"{row['module']} takes {row['import_seconds']:.3f}s to import "
+                                f"(budget {args.budget:.3f}s)")
+            if row["eager"]:
+                failures.append(f"{row['module']} imports {', '.join(row['eager'])} at startup")
+        print(f"background warm-up: {warm_up_seconds:.2f}s")
+        for message in failures:
+            print(f"OVER BUDGET {message}")
+        if failures:
+            sys.exit(1)
+        print("All front ends start within budget.")
+
+    elif args.bench == "check":
+        results = run_checks(args.only)
+        for name, failures in results.items():
+            print(f"{'FAIL' if failures else 'ok':>4}  {name}")
+            for message in failures:
+                print(f"      {message}")
+        if any(results.values()):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# face_sorter_cache.py
+
+import hashlib
+import json
+import os
+import numpy as np
+from face_sorter_files import atomic_write
+
+CACHE_VERSION = 2  # 2: face tracks split at scene cuts and identity changes
+CACHE_MAX_BYTES = 2 * 1024 ** 3  # 2 GiB
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_fingerprint(video_path, content_hash=False):
+    """
+    Identifies a video file by absolute path, size and mtime, or by a SHA-1
+    of its contents when content_hash is True (survives moves and touches).
+    """
+    stat = os.stat(video_path)
+    if content_hash:
+        digest = hashlib.sha1()
+        with open(video_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return {"sha1": digest.hexdigest(), "size": stat.st_size}
+    return {"path": os.path.abspath(video_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class FaceCache:
+    """
+    On-disk cache of per-video face records (structured numpy arrays).
+
+    Each entry is a plain .npy file, so it can be memory-mapped on load, plus
+    a small .json sidecar describing the source video. Entries are keyed on
+    the video fingerprint and the detector settings that produced them, so a
+    changed file or a different FRAME_INTERVAL simply misses. When the cache
+    grows past max_bytes, the least recently used entries are evicted.
+
+    Entries are written atomically and never shared between keys, so several
+    worker processes can use the same cache directory at once.
+    """
+
+    def __init__(self, cache_dir, max_bytes=CACHE_MAX_BYTES, content_hash=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, video_path, settings):
+        payload = {
+            "version": CACHE_VERSION,
+            "file": file_fingerprint(video_path, self.content_hash),
+            "settings": settings,
+        }
+        return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".npy", base + ".json"
+
+    def get(self, video_path, settings, mmap=True, dtype=None):
+        """
+        Returns the cached face records for video_path, or None on a miss.
+        Entries written with a different record layout than dtype also miss.
+        """
+        data_path, _ = self._paths(self._key(video_path, settings))
+        try:
+            records = np.load(data_path, mmap_mode="r" if mmap else None, allow_pickle=False)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        if dtype is not None and records.dtype != dtype:
+            return None
+        try:
+            os.utime(data_path)  # mark as recently used for eviction
+        except OSError:
+            pass
+        return records
+
+    def put(self, video_path, settings, records):
+        key = self._key(video_path, settings)
+        data_path, meta_path = self._paths(key)
+        # Sidecar first, so every data file has one
+        with atomic_write(meta_path) as f:
+            json.dump({"video": os.path.abspath(video_path), "settings": settings, "faces": len(records)}, f)
+        with atomic_write(data_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(records), allow_pickle=False)
+
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.name[:-4]))
+        return entries
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def size_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, max_bytes=None):
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+        Returns the number of entries removed.
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in entries:
+            if total <= max_bytes:
+                break
+            self._remove(key)
+            total -= size
+            removed += 1
+        return removed
+
+    def _video(self, key):
+        # Source video named by the entry's sidecar, or None if it cannot be read
+        try:
+            with open(self._paths(key)[1], "r") as f:
+                return json.load(f).get("video")
+        except (FileNotFoundError, ValueError, AttributeError):
+            return None
+
+    def invalidate(self, video_path=None):
+        """
+        Drops every entry for video_path (all settings), or the whole cache
+        when video_path is None. Returns the number of entries removed.
+        Entries whose sidecar cannot be read may belong to any video, so
+        they are left for prune().
+        """
+        target = os.path.abspath(video_path) if video_path else None
+        removed = 0
+        for _, _, key in self._entries():
+            if target is not None and self._video(key) != target:
+                continue
+            self._remove(key)
+            removed += 1
+        return removed
+
+    def prune(self):
+        """
+        Drops entries whose source video no longer exists or whose sidecar
+        cannot be read, and sidecars left without their data file.
+        Returns the number of entries removed.
+        """
+        removed = 0
+        keys = set()
+        for _, _, key in self._entries():
+            keys.add(key)
+            video = self._video(key)
+            if not video or not os.path.exists(video):
+                self._remove(key)
+                removed += 1
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json") and entry.name[:-5] not in keys:
+                self._remove(entry.name[:-5])
+        return removed
@@ -0,0 +1,308 @@
+# face_sorter_cli.py
+
+import argparse
+import glob
+import json
+import os
+import signal
+import sys
+import time
+from face_sorter_backend import (
+    ADAPTIVE_COARSE_FACTOR, DETECTION_SCALE, FRAME_INTERVAL, GATE_THRESHOLD, NUM_WORKERS, TRIAGE_MIN_GAP, ScanCancelled,
+    ScanControl, check_detection_scale, check_distinct_names, detector_settings, flagged_videos, list_videos,
+    scan_and_save_all, triage_videos,
+)
+from face_sorter_gallery import GALLERY_AGGREGATE, GalleryIndex
+from face_sorter_metrics import STAGES
+from face_sorter_store import RESULTS_DB_FILENAME, ResultsStore
+from face_sorter_watch import WATCH_POLL_SECONDS, WATCH_SETTLE_SECONDS, watch_folder
+
+PROGRESS_EVERY = 1.0  # seconds between frame progress lines per video
+EXIT_CANCELLED = 130
+TRIAGE_FILENAME = "triage.json"
+
+
+def expand_videos(patterns):
+    """
+    Expands folders (their .mp4 files, as list_videos), glob patterns
+    (recursive "**" allowed) and plain paths into a sorted list of video
+    files without duplicates. Raises ValueError if two different files
+    share a name, since results are keyed by file name.
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.update(os.path.abspath(path) for path in list_videos(pattern))
+        else:
+            paths.update(os.path.abspath(path) for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    paths = sorted(paths)
+    check_distinct_names(paths)
+    return paths
+
+
+def detection_scale_arg(text):
+    """
+    argparse type for --detection-scale: "auto" or a factor in (0, 1].
+    """
+    try:
+        return check_detection_scale(text if text == "auto" else float(text))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"must be 'auto' or a number in (0, 1], got {text!r}")
+
+
+def load_flagged(triage_path, names=None):
+    """
+    Returns the videos a saved triage report flagged (for anyone, or for
+    anyone in names).
+    """
+    with open(triage_path, "r") as f:
+        report = json.load(f)
+    return flagged_videos(report["videos"], names)
+
+
+class ProgressPrinter:
+    """
+    Writes scan progress to stdout, either as short text lines or as one
+    JSON object per line ("jsonl") for other programs to consume. Frame
+    progress is throttled to one line per video every PROGRESS_EVERY seconds.
+    """
+
+    def __init__(self, mode="text", stream=sys.stdout):
+        self.mode = mode
+        self.stream = stream
+        self.last_frames = {}
+
+    def emit(self, event, text=None, **fields):
+        if self.mode == "none":
+            return
+        if self.mode == "jsonl":
+            self.stream.write(json.dumps({"event": event, "time": round(time.time(), 3), **fields}) + "\n")
+        elif text:
+            self.stream.write(text + "\n")
+        self.stream.flush()
+
+    def video_done(self, finished, total, video_name):
+        self.last_frames.pop(video_name, None)
+        self.emit("video_done", f"[{finished}/{total}] {video_name}",
+                  finished=finished, total=total, video=video_name)
+
+    def frames(self, video_name, frames_done, frames_total, fps):
+        now = time.monotonic()
+        if frames_done < frames_total and now - self.last_frames.get(video_name, 0.0) < PROGRESS_EVERY:
+            return
+        self.last_frames[video_name] = now
+        self.emit("frames", f"    {video_name}: frame {frames_done}/{frames_total} · {fps:.1f} frames/s",
+                  video=video_name, frames_done=frames_done, frames_total=frames_total, fps=round(fps, 2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Scan videos for known people without the GUI (cron and server batch runs)"
+    )
+    parser.add_argument("--people", required=True,
+                        help="gallery of reference photos: <dir>/<name>/*.jpg or <dir>/<name>.jpg")
+    parser.add_argument("--videos", required=True, nargs="+",
+                        help="video files, folders or glob patterns (quote them; ** is recursive)")
+    parser.add_argument("--output", default="output", help="results folder (default: output)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or NUM_WORKERS)
+    parser.add_argument("--interval", type=float, default=FRAME_INTERVAL, help="seconds between samples")
+    parser.add_argument("--adaptive", action="store_true",
+                        help=f"coarse-to-fine sampling from a step of {ADAPTIVE_COARSE_FACTOR:g}x --interval, saved as "
+                             "segments; appearances shorter than that step can be missed")
+    parser.add_argument("--detection-scale", type=detection_scale_arg, default=DETECTION_SCALE,
+                        help="'auto' or a factor in (0, 1]")
+    parser.add_argument("--gate-threshold", type=float, default=GATE_THRESHOLD, help="0 disables frame gating")
+    parser.add_argument("--aggregate", choices=["centroid", "all"], default=GALLERY_AGGREGATE,
+                        help="match each person's mean encoding or every reference photo")
+    parser.add_argument("--no-cache", action="store_true", help="always decode instead of using the face cache")
+    parser.add_argument("--no-resume", action="store_true", help="rescan videos the manifest marks as done")
+    parser.add_argument("--progress", choices=["text", "jsonl", "none"], default="text",
+                        help="progress on stdout; jsonl prints one JSON event per line")
+    parser.add_argument("--prometheus", help="also write run metrics to this Prometheus textfile")
+    parser.add_argument("--triage", action="store_true",
+                        help=f"only check which videos each person is in, from keyframes; writes {TRIAGE_FILENAME}")
+    parser.add_argument("--triage-gap", type=float, default=TRIAGE_MIN_GAP,
+                        help="minimum seconds between the keyframes a triage examines")
+    parser.add_argument("--from-triage", metavar="TRIAGE_JSON",
+                        help="limit the scan to the videos this triage report flagged")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and scan .mp4 files as they appear in the --videos folders")
+    parser.add_argument("--settle", type=float, default=WATCH_SETTLE_SECONDS,
+                        help="seconds a file must stay unchanged before --watch scans it")
+    parser.add_argument("--poll", type=float, default=WATCH_POLL_SECONDS, help="seconds between --watch polls")
+    args = parser.parse_args(argv)
+
+    printer = ProgressPrinter(args.progress)
+    detection_scale = args.detection_scale
+
+    gallery_stats = {}
+    known_people = GalleryIndex.load(args.people).update(args.workers, gallery_stats).known_people(args.aggregate)
+    if not known_people:
+        printer.emit("error", f"No reference faces found in {args.people}", message="no reference faces")
+        return 1
+    if args.watch:
+        return run_watch(args, known_people, printer, detection_scale)
+    try:
+        video_paths = expand_videos(args.videos)
+    except ValueError as e:
+        printer.emit("error", str(e), message=str(e))
+        return 1
+    if args.from_triage:
+        flagged = {os.path.abspath(path) for path in load_flagged(args.from_triage)}
+        video_paths = [path for path in video_paths if os.path.abspath(path) in flagged]
+    if not video_paths:
+        printer.emit("error", f"No videos match {' '.join(args.videos)}", message="no videos")
+        return 1
+    names = sorted({person[0] for person in known_people})
+    printer.emit("start", f"{'Triaging' if args.triage else 'Scanning'} {len(video_paths)} videos for {len(names)} people with {args.workers} workers",
+                 videos=len(video_paths), people=names, workers=args.workers, **gallery_stats)
+
+    # SIGINT/SIGTERM stop the scan at the next frame; the manifest keeps the progress
+    control = ScanControl()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: control.cancel())
+
+    if args.triage:
+        return run_triage(args, known_people, video_paths, control, printer, detection_scale)
+
+    stats = {}
+    started = time.perf_counter()
+    try:
+        saved_files = scan_and_save_all(
+            known_people, None, args.output,
+            progress_callback=printer.video_done,
+            frame_callback=printer.frames if args.progress != "none" else None,
+            num_workers=args.workers,
+            use_cache=not args.no_cache,
+            detection_scale=detection_scale,
+            adaptive=args.adaptive,
+            gate_threshold=args.gate_threshold,
+            stats=stats,
+            control=control,
+            resume=not args.no_resume,
+            prometheus_path=args.prometheus,
+            video_paths=video_paths,
+            frame_interval=args.interval,
+        )
+    except ScanCancelled:
+        printer.emit("cancelled", "Scan cancelled; rerun the same command to resume.")
+        return EXIT_CANCELLED
+    except Exception as e:
+        printer.emit("error", f"Scan failed: {e}", message=str(e))
+        return 1
+
+    seconds = time.perf_counter() - started
+    printer.emit(
+        "done",
+        f"Done in {seconds:.1f}s: {stats.get('samples', 0)} frames sampled, {stats.get('matches', 0)} matches, "
+        f"{stats.get('errors', 0)} errors",
+        seconds=round(seconds, 3), files=saved_files,
+        stats={key: value for key, value in stats.items() if not key.endswith("_seconds")},
+        stages={stage: round(stats.get(f"{stage}_seconds", 0.0), 3) for stage in STAGES},
+    )
+    if args.progress == "text":
+        with ResultsStore(os.path.join(args.output, RESULTS_DB_FILENAME)) as store:
+            for name in names:
+                lines = store.person_text_lines(name)
+                print(f"{name}: {len(lines)} videos")
+                for line in lines:
+                    print(f"  {line}")
+    return 1 if stats.get("errors") else 0
+
+
+def run_watch(args, known_people, printer, detection_scale):
+    """
+    The --watch mode of main(): scans new and changed videos in the
+    --videos folders until SIGINT or SIGTERM, which ends it normally.
+    """
+    video_dirs = [path for path in args.videos if os.path.isdir(path)]
+    if len(video_dirs) != len(args.videos):
+        printer.emit("error", "--watch needs folders for --videos", message="not a folder")
+        return 1
+    names = sorted({person[0] for person in known_people})
+    printer.emit("start", f"Watching {', '.join(video_dirs)} for {len(names)} people with {args.workers} workers",
+                 folders=video_dirs, people=names, workers=args.workers)
+
+    control = ScanControl()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: control.cancel())
+
+    scanned = []
+
+    def on_event(event, video_path, details):
+        video = os.path.basename(video_path)
+        if event in ("done", "failed"):
+            scanned.append(video_path)
+            found = ", ".join(f"{name} ({hits})" for name, hits in details["hits"].items() if hits) or "nobody"
+            text = f"{video}: {found} in {details.get('video_seconds', 0.0):.1f}s"
+            if event == "failed":
+                text += f" ({details['errors']} errors, will retry)"
+        else:
+            text = f"{video}: {event}"
+        printer.emit(event, text, video=video, **details)
+
+    stats = {}
+    try:
+        watch_folder(known_people, video_dirs, args.output, args.workers,
+                     detector_settings(args.interval, detection_scale, args.gate_threshold),
+                     not args.no_cache, control, on_event, stats, args.poll, args.settle)
+    except ScanCancelled:
+        printer.emit("stopped", f"Stopped watching; {len(scanned)} videos scanned", videos=len(scanned),
+                     stats={key: value for key, value in stats.items() if not key.endswith("_seconds")})
+        return 0
+    except Exception as e:
+        printer.emit("error", f"Watching failed: {e}", message=str(e))
+        return 1
+
+
+def run_triage(args, known_people, video_paths, control, printer, detection_scale):
+    """
+    The --triage mode of main(): reports who appears in which video and
+    saves the report as TRIAGE_FILENAME in the output folder.
+    """
+    stats = {}
+    started = time.perf_counter()
+    try:
+        results = triage_videos(known_people, video_paths, args.workers,
+                                lambda finished, total, path: printer.video_done(finished, total,
+                                                                                 os.path.basename(path)),
+                                detector_settings(args.interval, detection_scale, args.gate_threshold),
+                                args.triage_gap, stats, control)
+    except ScanCancelled:
+        printer.emit("cancelled", "Triage cancelled.")
+        return EXIT_CANCELLED
+    except Exception as e:
+        printer.emit("error", f"Triage failed: {e}", message=str(e))
+        return 1
+
+    report = {
+        "people": sorted({person[0] for person in known_people}),
+        "min_gap": args.triage_gap,
+        "videos": {
+            os.path.abspath(path): {name: {"t": t, "confidence": confidence}
+                                    for name, (t, confidence) in presence.items()}
+            for path, presence in results.items()
+        },
+    }
+    os.makedirs(args.output, exist_ok=True)
+    triage_path = os.path.join(args.output, TRIAGE_FILENAME)
+    with open(triage_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    seconds = time.perf_counter() - started
+    flagged = flagged_videos(results)
+    printer.emit(
+        "done",
+        f"Triaged {len(video_paths)} videos in {seconds:.1f}s ({stats.get('samples', 0)} keyframes); "
+        f"{len(flagged)} flagged, saved to {triage_path}",
+        seconds=round(seconds, 3), files=[triage_path], flagged=flagged,
+        presence={path: sorted(presence) for path, presence in results.items()},
+    )
+    if args.progress == "text":
+        for path, presence in results.items():
+            print(f"{os.path.basename(path)}: {', '.join(sorted(presence)) or '-'}")
+    return 1 if stats.get("errors") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
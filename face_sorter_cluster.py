@@ -0,0 +1,421 @@
+# face_sorter_cluster.py
+
+import argparse
+import bisect
+import json
+import os
+import numpy as np
+from PIL import Image
+from face_sorter_backend import (
+    CACHE_DIRNAME, NUM_WORKERS, check_distinct_names, count, detector_settings, list_videos, load_video_faces,
+    match_confidence, worker_pool,
+)
+from face_sorter_cache import FaceCache
+from face_sorter_metrics import merge_stats, peak_memory
+from face_sorter_store import ResultsStore
+
+# A track joins the nearest cluster whose centroid is within this distance,
+# otherwise it starts a new cluster
+CLUSTER_TOLERANCE = 0.45
+# After the pass, clusters whose centroids are this close are merged
+CLUSTER_MERGE_TOLERANCE = 0.35
+CLUSTER_MIN_FACES = 3      # smaller clusters are dropped from the export
+CLUSTER_EXEMPLARS = 5      # representative faces kept (and exported) per cluster
+CLUSTER_CHUNK = 4096       # rows per block of the chunked distance computation
+THUMBNAIL_MARGIN = 0.25    # crop margin around a face box, as a share of its size
+CLUSTER_DB_FILENAME = "clusters.sqlite3"
+
+# One row per face track of a video: its mean encoding and where it was seen
+TRACK_DTYPE = np.dtype([
+    ("start", np.float64),
+    ("end", np.float64),
+    ("encoding", np.float32, (128,)),
+    ("faces", np.int32),
+    ("rep_t", np.float64),  # the track's largest face, used as its thumbnail
+    ("rep_box", np.int32, (4,)),
+])
+
+# Set once per worker process by _init_worker
+_worker = {}
+
+
+def summarize_tracks(records):
+    """
+    Collapses FACE_DTYPE records into one TRACK_DTYPE row per FaceTracker
+    track, so a face followed across many samples is clustered once.
+    """
+    if len(records) == 0:
+        return np.empty(0, dtype=TRACK_DTYPE)
+    track_ids, inverse = np.unique(records["track"], return_inverse=True)
+    inverse = inverse.reshape(-1)
+    summary = np.zeros(len(track_ids), dtype=TRACK_DTYPE)
+
+    faces = np.bincount(inverse, minlength=len(track_ids))
+    sums = np.zeros((len(track_ids), 128))
+    np.add.at(sums, inverse, records["encoding"])
+    summary["encoding"] = sums / faces[:, None]
+    summary["faces"] = faces
+
+    summary["start"] = np.inf
+    summary["end"] = -np.inf
+    np.minimum.at(summary["start"], inverse, records["t"])
+    np.maximum.at(summary["end"], inverse, records["t"])
+
+    boxes = records["box"]
+    areas = (boxes[:, 1] - boxes[:, 3]) * (boxes[:, 2] - boxes[:, 0])
+    order = np.lexsort((-areas, inverse))  # by track, largest face first
+    first = order[np.searchsorted(inverse[order], np.arange(len(track_ids)))]
+    summary["rep_t"] = records["t"][first]
+    summary["rep_box"] = boxes[first]
+    return summary
+
+
+def nearest_rows(vectors, matrix, chunk_size=CLUSTER_CHUNK):
+    """
+    Returns (index, distance) of the nearest row of matrix for each vector,
+    computing distances in chunk_size x chunk_size blocks so memory stays
+    bounded however many rows there are. index is -1 when matrix is empty.
+    """
+    vectors = np.asarray(vectors, dtype=np.float64).reshape(len(vectors), -1)
+    best_idx = np.full(len(vectors), -1, dtype=np.intp)
+    best_sq = np.full(len(vectors), np.inf)
+    if len(matrix) == 0:
+        return best_idx, best_sq
+    matrix_sq = np.einsum("ij,ij->i", matrix, matrix)
+    for v_start in range(0, len(vectors), chunk_size):
+        block = vectors[v_start:v_start + chunk_size]
+        block_sq = np.einsum("ij,ij->i", block, block)[:, None]
+        rows = np.arange(len(block))
+        for m_start in range(0, len(matrix), chunk_size):
+            sq = block_sq + matrix_sq[None, m_start:m_start + chunk_size] - 2.0 * block @ matrix[m_start:m_start + chunk_size].T
+            idx = np.argmin(sq, axis=1)
+            val = sq[rows, idx]
+            better = val < best_sq[v_start:v_start + chunk_size]
+            best_sq[v_start:v_start + chunk_size][better] = val[better]
+            best_idx[v_start:v_start + chunk_size][better] = idx[better] + m_start
+    return best_idx, np.sqrt(np.maximum(best_sq, 0.0))
+
+
+class FaceClusterer:
+    """
+    Online centroid clustering of face encodings.
+
+    Each batch is assigned to the nearest existing centroid within
+    tolerance (a chunked search, see nearest_rows); anything further away
+    starts a new cluster that the rest of the batch can join. Centroids are
+    face-weighted running means. Only per-cluster sums, counts and a few
+    exemplar faces are held, so memory grows with the number of clusters,
+    not the number of faces. merge() then joins clusters whose centroids
+    ended up close together, with union-find over a chunked neighbour search.
+    """
+
+    def __init__(self, tolerance=CLUSTER_TOLERANCE, exemplars=CLUSTER_EXEMPLARS, chunk_size=CLUSTER_CHUNK):
+        self.tolerance = tolerance
+        self.max_exemplars = exemplars
+        self.chunk_size = chunk_size
+        self.sums = np.zeros((0, 128))
+        self.faces = np.zeros(0, dtype=np.int64)
+        self.tracks = np.zeros(0, dtype=np.int64)
+        self.size = 0
+        self.exemplars = []  # cluster -> [(distance, video_path, t, box)], closest first
+
+    def centroids(self):
+        return self.sums[:self.size] / self.faces[:self.size, None]
+
+    def _new_cluster(self):
+        if self.size == len(self.faces):
+            capacity = max(64, 2 * self.size)
+            self.sums = np.resize(self.sums, (capacity, 128))
+            self.faces = np.resize(self.faces, capacity)
+            self.tracks = np.resize(self.tracks, capacity)
+        self.sums[self.size] = 0.0
+        self.faces[self.size] = 0
+        self.tracks[self.size] = 0
+        self.exemplars.append([])
+        self.size += 1
+        return self.size - 1
+
+    def _offer_exemplar(self, label, distance, video_path, t, box):
+        exemplars = self.exemplars[label]
+        if len(exemplars) < self.max_exemplars or distance < exemplars[-1][0]:
+            bisect.insort(exemplars, (distance, video_path, t, tuple(box)))
+            del exemplars[self.max_exemplars:]
+
+    def add(self, video_path, tracks):
+        """
+        Clusters a video's TRACK_DTYPE rows. Returns (labels, distances),
+        the cluster of each track and its distance to that cluster's
+        centroid when assigned.
+        """
+        encodings = tracks["encoding"].astype(np.float64)
+        labels, distances = nearest_rows(encodings, self.centroids(), self.chunk_size)
+        base = self.size
+        for i in np.flatnonzero(~(distances <= self.tolerance)):
+            # Tracks this batch could not place may match clusters it created
+            if self.size > base:
+                idx, dist = nearest_rows(encodings[i:i + 1], self.centroids()[base:], self.chunk_size)
+                if dist[0] <= self.tolerance:
+                    labels[i], distances[i] = idx[0] + base, dist[0]
+                    self.sums[labels[i]] += encodings[i] * tracks["faces"][i]
+                    self.faces[labels[i]] += tracks["faces"][i]
+                    continue
+            labels[i], distances[i] = self._new_cluster(), 0.0
+            self.sums[labels[i]] += encodings[i] * tracks["faces"][i]
+            self.faces[labels[i]] += tracks["faces"][i]
+
+        existing = labels < base
+        np.add.at(self.sums, labels[existing], encodings[existing] * tracks["faces"][existing][:, None])
+        np.add.at(self.faces, labels[existing], tracks["faces"][existing])
+        np.add.at(self.tracks, labels, 1)
+        for label, distance, t, box in zip(labels.tolist(), distances.tolist(), tracks["rep_t"].tolist(),
+                                           tracks["rep_box"]):
+            self._offer_exemplar(label, distance, video_path, t, box)
+        return labels, distances
+
+    def merge(self, tolerance=CLUSTER_MERGE_TOLERANCE):
+        """
+        Joins clusters with centroids within tolerance of each other
+        (transitively) and returns the old -> new cluster index mapping.
+        """
+        parent = np.arange(self.size)
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        centroids = self.centroids()
+        sq_norms = np.einsum("ij,ij->i", centroids, centroids)
+        step = self.chunk_size
+        for a in range(0, self.size, step):
+            for b in range(a, self.size, step):
+                sq = (sq_norms[a:a + step, None] + sq_norms[None, b:b + step]
+                      - 2.0 * centroids[a:a + step] @ centroids[b:b + step].T)
+                for i, j in zip(*np.nonzero(sq <= tolerance ** 2)):
+                    root_i, root_j = find(a + i), find(b + j)
+                    if root_i != root_j:
+                        parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        roots = np.array([find(i) for i in range(self.size)], dtype=np.intp)
+        _, mapping = np.unique(roots, return_inverse=True)
+        mapping = mapping.reshape(-1)
+        size = int(mapping.max()) + 1 if self.size else 0
+        sums = np.zeros((size, 128))
+        faces = np.zeros(size, dtype=np.int64)
+        tracks = np.zeros(size, dtype=np.int64)
+        np.add.at(sums, mapping, self.sums[:self.size])
+        np.add.at(faces, mapping, self.faces[:self.size])
+        np.add.at(tracks, mapping, self.tracks[:self.size])
+        exemplars = [[] for _ in range(size)]
+        for old, new in enumerate(mapping.tolist()):
+            exemplars[new].extend(self.exemplars[old])
+        self.sums, self.faces, self.tracks, self.size = sums, faces, tracks, size
+        self.exemplars = [sorted(group)[:self.max_exemplars] for group in exemplars]
+        return mapping
+
+
+def _summarize_video(video_path, cache, settings, control=None):
+    stats = {}
+    with peak_memory(stats):
+        records = load_video_faces(video_path, cache, settings, stats, control)
+    count(stats, "faces_clustered", len(records))
+    return summarize_tracks(records), stats
+
+
+def _init_worker(cache_dir, settings, control):
+    _worker.update(cache=FaceCache(cache_dir) if cache_dir else None, settings=settings, control=control)
+
+
+def _summarize_video_worker(video_path):
+    return _summarize_video(video_path, _worker["cache"], _worker["settings"], _worker["control"])
+
+
+def iter_track_summaries(video_paths, num_workers=None, cache_dir=None, settings=None, control=None):
+    """
+    Yields (video_path, tracks, stats) for each video in input order, with
+    videos summarized by a pool of num_workers processes when num_workers > 1.
+    """
+    if num_workers is None:
+        num_workers = NUM_WORKERS
+    if num_workers <= 1 or len(video_paths) <= 1:
+        cache = FaceCache(cache_dir) if cache_dir else None
+        for video_path in video_paths:
+            yield (video_path, *_summarize_video(video_path, cache, settings, control))
+        return
+
+    with worker_pool(min(num_workers, len(video_paths)), _init_worker, (cache_dir, settings, control), control) as pool:
+        futures = [pool.submit(_summarize_video_worker, path) for path in video_paths]
+        for video_path, future in zip(video_paths, futures):
+            yield (video_path, *future.result())
+
+
+def save_face_crop(frame, box, path, margin=THUMBNAIL_MARGIN):
+    top, right, bottom, left = box
+    pad_y, pad_x = int((bottom - top) * margin), int((right - left) * margin)
+    height, width = frame.shape[:2]
+    crop = frame[max(0, top - pad_y):min(height, bottom + pad_y), max(0, left - pad_x):min(width, right + pad_x)]
+    Image.fromarray(np.ascontiguousarray(crop)).save(path, quality=90)
+
+
+def export_exemplars(clusters, output_dir):
+    """
+    Saves each cluster's exemplar faces to output_dir/clusters/<name>/ and
+    its closest one to output_dir/thumbnails/<name>.jpg. clusters is a list
+    of (name, exemplars); each video is opened once. Returns
+    { name: [exemplar paths] }.
+    """
+    from moviepy import VideoFileClip
+
+    by_video = {}
+    for name, exemplars in clusters:
+        os.makedirs(os.path.join(output_dir, "clusters", name), exist_ok=True)
+        for rank, (_, video_path, t, box) in enumerate(exemplars):
+            by_video.setdefault(video_path, []).append((name, rank, t, box))
+    os.makedirs(os.path.join(output_dir, "thumbnails"), exist_ok=True)
+
+    paths = {name: [] for name, _ in clusters}
+    for video_path, faces in sorted(by_video.items()):
+        clip = VideoFileClip(video_path, audio=False)
+        try:
+            for name, rank, t, box in sorted(faces, key=lambda face: face[2]):
+                frame = clip.get_frame(t)
+                filename = f"{rank:02d}_{os.path.splitext(os.path.basename(video_path))[0]}_{t:.2f}.jpg"
+                path = os.path.join(output_dir, "clusters", name, filename)
+                save_face_crop(frame, box, path)
+                paths[name].append(path)
+                if rank == 0:
+                    save_face_crop(frame, box, os.path.join(output_dir, "thumbnails", f"{name}.jpg"))
+        finally:
+            clip.close()
+    for name in paths:
+        paths[name].sort()
+    return paths
+
+
+def cluster_library(video_dir, output_dir, num_workers=None, use_cache=True, cache_dir=None, settings=None,
+                    tolerance=CLUSTER_TOLERANCE, merge_tolerance=CLUSTER_MERGE_TOLERANCE,
+                    min_faces=CLUSTER_MIN_FACES, progress_callback=None, stats=None, control=None):
+    """
+    Groups every face in the videos of video_dir into identities, without
+    reference photos.
+
+    Faces come from the same detection as scan_and_save_all (and share its
+    face cache). Each face track is reduced to its mean encoding, and
+    tracks are streamed through a FaceClusterer one video at a time, so
+    only the cluster centroids and exemplars stay in memory. Track
+    appearances are staged on disk in SQLite as they are assigned. After
+    the pass, near-duplicate clusters are merged, clusters with fewer than
+    min_faces faces are dropped, and the rest are named person_000,
+    person_001, ... by size.
+
+    Writes to output_dir:
+        clusters/<name>/      exemplar face crops
+        thumbnails/<name>.jpg the most central face of each cluster
+        metadata/clusters.json, faces.csv, appearances.json, CLUSTER_DB_FILENAME
+    Returns the list of cluster summaries saved in clusters.json.
+
+    If progress_callback is provided, it is called as each video is clustered:
+        progress_callback(finished_count, total_videos, video_name)
+    stats and control work as in scan_and_save_all; stats also receives
+    "faces_clustered", "tracks_clustered" and "clusters".
+    """
+    video_paths = list_videos(video_dir)
+    check_distinct_names(video_paths)
+    if settings is None:
+        settings = detector_settings()
+    if use_cache and cache_dir is None:
+        cache_dir = os.path.join(output_dir, CACHE_DIRNAME)
+    metadata_dir = os.path.join(output_dir, "metadata")
+    os.makedirs(metadata_dir, exist_ok=True)
+
+    clusterer = FaceClusterer(tolerance)
+    with ResultsStore(os.path.join(metadata_dir, CLUSTER_DB_FILENAME)) as store:
+        with store.conn:
+            store.conn.execute("DELETE FROM appearances")
+            store.conn.execute("DROP TABLE IF EXISTS cluster_tracks")
+            store.conn.execute(
+                "CREATE TABLE cluster_tracks (cluster INTEGER NOT NULL, video TEXT NOT NULL, "
+                "start_time REAL NOT NULL, end_time REAL NOT NULL, confidence REAL)"
+            )
+
+        summaries = iter_track_summaries(video_paths, num_workers, cache_dir if use_cache else None, settings,
+                                         control)
+        for finished, (video_path, tracks, video_stats) in enumerate(summaries, start=1):
+            merge_stats(stats, video_stats)
+            count(stats, "tracks_clustered", len(tracks))
+            if len(tracks):
+                labels, distances = clusterer.add(video_path, tracks)
+                with store.conn:
+                    store.conn.executemany(
+                        "INSERT INTO cluster_tracks VALUES (?, ?, ?, ?, ?)",
+                        zip(labels.tolist(), [os.path.basename(video_path)] * len(tracks),
+                            np.round(tracks["start"], 2).tolist(), np.round(tracks["end"], 2).tolist(),
+                            [match_confidence(d) for d in distances.tolist()]),
+                    )
+            if progress_callback:
+                progress_callback(finished, len(video_paths), os.path.basename(video_path))
+
+        mapping = clusterer.merge(merge_tolerance)
+        order = [int(idx) for idx in np.argsort(-clusterer.faces[:clusterer.size], kind="stable")
+                 if clusterer.faces[idx] >= min_faces]
+        names = {idx: f"person_{rank:03d}" for rank, idx in enumerate(order)}
+        count(stats, "clusters", len(order))
+
+        with store.conn:
+            store.conn.execute("CREATE TEMP TABLE cluster_names (cluster INTEGER PRIMARY KEY, person TEXT NOT NULL)")
+            store.conn.executemany(
+                "INSERT INTO cluster_names VALUES (?, ?)",
+                [(old, names[new]) for old, new in enumerate(mapping.tolist()) if new in names],
+            )
+            store.conn.execute(
+                "INSERT OR REPLACE INTO appearances (person, video, start_time, end_time, confidence) "
+                "SELECT n.person, c.video, c.start_time, c.end_time, c.confidence "
+                "FROM cluster_tracks c JOIN cluster_names n ON n.cluster = c.cluster"
+            )
+            store.conn.execute("DROP TABLE cluster_names")
+
+        exemplar_paths = export_exemplars([(names[idx], clusterer.exemplars[idx]) for idx in order], output_dir)
+        clusters = []
+        for idx in order:
+            name = names[idx]
+            clusters.append({
+                "name": name,
+                "faces": int(clusterer.faces[idx]),
+                "tracks": int(clusterer.tracks[idx]),
+                "videos": sorted({video for video, _, _, _ in store.by_person(name)}),
+                "thumbnail": os.path.join(output_dir, "thumbnails", f"{name}.jpg"),
+                "exemplars": exemplar_paths[name],
+            })
+        with open(os.path.join(metadata_dir, "clusters.json"), "w") as f:
+            json.dump(clusters, f, indent=2)
+        store.export_csv(os.path.join(metadata_dir, "faces.csv"))
+        store.export_json(os.path.join(metadata_dir, "appearances.json"))
+    return clusters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Group every face in a video folder into identities")
+    parser.add_argument("video_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--tolerance", type=float, default=CLUSTER_TOLERANCE)
+    parser.add_argument("--merge-tolerance", type=float, default=CLUSTER_MERGE_TOLERANCE)
+    parser.add_argument("--min-faces", type=int, default=CLUSTER_MIN_FACES)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    stats = {}
+    clusters = cluster_library(
+        args.video_dir, args.output_dir, args.workers, use_cache=not args.no_cache,
+        tolerance=args.tolerance, merge_tolerance=args.merge_tolerance, min_faces=args.min_faces,
+        progress_callback=lambda done, total, name: print(f"[{done}/{total}] {name}"), stats=stats,
+    )
+    print(f"{len(clusters)} identities from {stats.get('faces_clustered', 0)} faces "
+          f"({stats.get('tracks_clustered', 0)} tracks)")
+    for cluster in clusters:
+        print(f"  {cluster['name']}: {cluster['faces']} faces in {len(cluster['videos'])} videos")
+
+
+if __name__ == "__main__":
+    main()
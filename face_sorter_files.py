@@ -0,0 +1,30 @@
+# face_sorter_files.py
+
+import contextlib
+import os
+import threading
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w"):
+    """
+    Opens a temporary file next to path for writing and, once the block
+    completes, flushes it to disk and renames it over path, so readers
+    (and a crash or power cut) see either the old or the new contents,
+    never a partial file. If the block raises, path is left untouched.
+    The temporary name is unique per process and thread.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
@@ -0,0 +1,199 @@
+# face_sorter_gallery.py
+
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from face_sorter_cache import file_fingerprint
+from face_sorter_files import atomic_write
+from face_sorter_models import register_heif_opener
+
+GALLERY_DIR = "gallery"
+GALLERY_INDEX_FILENAME = "gallery_index.npz"
+GALLERY_INDEX_VERSION = 1
+# "centroid" matches one mean encoding per person, "all" every reference encoding
+GALLERY_AGGREGATE = "centroid"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".heic", ".webp", ".bmp", ".tiff", ".gif")
+
+
+def encode_reference_image(image_path):
+    """
+    Returns the encoding of the largest face in image_path, or None if it has no face.
+    """
+    import face_recognition
+
+    register_heif_opener()
+    image = face_recognition.load_image_file(image_path)
+    locations = face_recognition.face_locations(image)
+    if not locations:
+        return None
+    largest = max(locations, key=lambda box: (box[1] - box[3]) * (box[2] - box[0]))
+    return face_recognition.face_encodings(image, [largest])[0]
+
+
+def _encode_worker(image_path):
+    try:
+        return encode_reference_image(image_path)
+    except Exception as e:
+        print(f"Error encoding {image_path}: {e}")
+        return None
+
+
+def list_gallery_images(gallery_dir):
+    """
+    Returns sorted (person, image_path) pairs for gallery_dir/<person>/<image>.
+    Images directly in gallery_dir count as one photo of the person named
+    by the file (gallery_dir/<person>.jpg).
+    """
+    images = []
+    if not os.path.isdir(gallery_dir):
+        return images
+    for entry in sorted(os.listdir(gallery_dir)):
+        path = os.path.join(gallery_dir, entry)
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    images.append((entry, os.path.join(path, filename)))
+        elif entry.lower().endswith(IMAGE_EXTENSIONS):
+            images.append((os.path.splitext(entry)[0], path))
+    return images
+
+
+class GalleryIndex:
+    """
+    Reference encodings for a gallery directory with one folder of photos
+    per person (gallery_dir/<name>/*.jpg), or single photos named after the
+    person (gallery_dir/<name>.jpg).
+
+    Every image is stored with its path, size, mtime and SHA-1, and with the
+    encoding of its largest face (or none). The arrays are saved as a single
+    .npz in the gallery directory, so loading needs no face detection at
+    all. update() re-encodes only images that are new: unchanged files are
+    recognised by size and mtime, and renamed or copied ones by content
+    hash. The new images are encoded by a process pool.
+    """
+
+    FIELDS = ("people", "paths", "sizes", "mtimes", "sha1s", "has_face", "encodings")
+
+    def __init__(self, gallery_dir=GALLERY_DIR):
+        self.gallery_dir = gallery_dir
+        self.index_path = os.path.join(gallery_dir, GALLERY_INDEX_FILENAME)
+        self.people = np.empty(0, dtype=str)
+        self.paths = np.empty(0, dtype=str)
+        self.sizes = np.empty(0, dtype=np.int64)
+        self.mtimes = np.empty(0, dtype=np.int64)
+        self.sha1s = np.empty(0, dtype="S40")
+        self.has_face = np.empty(0, dtype=bool)
+        self.encodings = np.empty((0, 128), dtype=np.float32)
+
+    @classmethod
+    def load(cls, gallery_dir=GALLERY_DIR):
+        """
+        Loads the saved index of gallery_dir (empty if there is none yet)
+        without looking at the images.
+        """
+        index = cls(gallery_dir)
+        try:
+            with np.load(index.index_path, allow_pickle=False) as data:
+                if int(data["version"]) != GALLERY_INDEX_VERSION:
+                    return index
+                for field in cls.FIELDS:
+                    setattr(index, field, data[field])
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            pass
+        return index
+
+    def save(self):
+        with atomic_write(self.index_path, "wb") as f:
+            np.savez(f, version=GALLERY_INDEX_VERSION, **{field: getattr(self, field) for field in self.FIELDS})
+
+    def update(self, num_workers=None, stats=None):
+        """
+        Brings the index in line with the images on disk and saves it.
+        If stats is a dict, "images_encoded" and "images_reused" are filled in.
+        """
+        by_file = {(path, int(size), int(mtime)): idx
+                   for idx, (path, size, mtime) in enumerate(zip(self.paths, self.sizes, self.mtimes))}
+        by_hash = {sha1: idx for idx, sha1 in enumerate(self.sha1s.tolist())}
+
+        rows = []
+        to_encode = []
+        for person, path in list_gallery_images(self.gallery_dir):
+            stat = os.stat(path)
+            idx = by_file.get((path, stat.st_size, stat.st_mtime_ns))
+            sha1 = self.sha1s[idx] if idx is not None else file_fingerprint(path, content_hash=True)["sha1"].encode()
+            if idx is None:
+                idx = by_hash.get(sha1)
+            if idx is not None:
+                rows.append([person, path, stat.st_size, stat.st_mtime_ns, sha1,
+                             bool(self.has_face[idx]), self.encodings[idx]])
+            else:
+                to_encode.append(len(rows))
+                rows.append([person, path, stat.st_size, stat.st_mtime_ns, sha1, False, np.zeros(128)])
+
+        if to_encode:
+            paths = [rows[i][1] for i in to_encode]
+            num_workers = num_workers or os.cpu_count() or 1
+            if num_workers <= 1 or len(paths) <= 1:
+                encoded = [_encode_worker(path) for path in paths]
+            else:
+                with ProcessPoolExecutor(max_workers=min(num_workers, len(paths))) as pool:
+                    encoded = list(pool.map(_encode_worker, paths))
+            for i, encoding in zip(to_encode, encoded):
+                if encoding is not None:
+                    rows[i][5], rows[i][6] = True, encoding
+        if stats is not None:
+            stats["images_encoded"] = len(to_encode)
+            stats["images_reused"] = len(rows) - len(to_encode)
+
+        self.people = np.array([row[0] for row in rows], dtype=str)
+        self.paths = np.array([row[1] for row in rows], dtype=str)
+        self.sizes = np.array([row[2] for row in rows], dtype=np.int64)
+        self.mtimes = np.array([row[3] for row in rows], dtype=np.int64)
+        self.sha1s = np.array([row[4] for row in rows], dtype="S40")
+        self.has_face = np.array([row[5] for row in rows], dtype=bool)
+        self.encodings = np.array([row[6] for row in rows], dtype=np.float32).reshape(len(rows), 128)
+        self.save()
+        return self
+
+    def add_images(self, name, image_paths, num_workers=None):
+        """
+        Copies image_paths into the folder of person name and updates the
+        index. Returns the paths of images in which no face was found.
+        """
+        person_dir = os.path.join(self.gallery_dir, name)
+        os.makedirs(person_dir, exist_ok=True)
+        copied = []
+        for image_path in image_paths:
+            target = os.path.join(person_dir, os.path.basename(image_path))
+            if os.path.abspath(image_path) != os.path.abspath(target):
+                shutil.copy2(image_path, target)
+            copied.append(target)
+        self.update(num_workers)
+        return [path for path, found in zip(self.paths.tolist(), self.has_face.tolist())
+                if path in copied and not found]
+
+    def names(self):
+        return sorted(set(self.people[self.has_face].tolist()))
+
+    def known_people(self, aggregate=GALLERY_AGGREGATE, names=None):
+        """
+        Returns known_people tuples (name, encoding, image_path) for the
+        matcher, for all people (or only names). "centroid" gives one tuple
+        per person holding the mean of their encodings; "all" gives one tuple
+        per reference image, which scans treat as the same person.
+        """
+        if aggregate not in ("centroid", "all"):
+            raise ValueError(f"aggregate must be 'centroid' or 'all', got {aggregate!r}")
+        known_people = []
+        for name in self.names() if names is None else names:
+            rows = np.flatnonzero((self.people == name) & self.has_face)
+            if not len(rows):
+                continue
+            if aggregate == "centroid":
+                encoding = self.encodings[rows].astype(np.float64).mean(axis=0)
+                known_people.append((name, encoding, str(self.paths[rows[0]])))
+            else:
+                known_people.extend((name, self.encodings[idx].astype(np.float64), str(self.paths[idx]))
+                                    for idx in rows)
+        return known_people
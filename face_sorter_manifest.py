@@ -0,0 +1,117 @@
+# face_sorter_manifest.py
+
+import hashlib
+import json
+import os
+import numpy as np
+from face_sorter_cache import file_fingerprint
+from face_sorter_files import atomic_write
+
+MANIFEST_FILENAME = "scan_manifest.json"
+MANIFEST_VERSION = 2
+
+
+def scan_key(known_people, settings, adaptive):
+    """
+    Identifies what a scan looks for and how: the people (names and
+    encodings), the detector settings and the sampling mode. Saved progress
+    is only reused by a scan with the same key.
+    """
+    digest = hashlib.sha1()
+    for person in known_people:
+        digest.update(person[0].encode("utf-8"))
+        digest.update(np.asarray(person[1], dtype=np.float64).tobytes())
+    digest.update(json.dumps({"settings": settings, "adaptive": adaptive}, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _hits_from_json(results):
+    # JSON turns (start, end, confidence) hits into lists
+    return {name: [tuple(hit) if isinstance(hit, list) else hit for hit in hits] for name, hits in results.items()}
+
+
+class ScanManifest:
+    """
+    Per-video completion record for a scan, kept in output_dir so an
+    interrupted scan can pick up where it stopped.
+
+    Each video entry holds its status ("in_progress", "done", or "failed"
+    for a video that could not be read to the end), the file
+    fingerprint it was scanned with, the results so far and, while in
+    progress, the timestamp of the last checkpointed sample. The file is
+    rewritten atomically after every change, so a crash leaves either the
+    previous or the new manifest on disk. A manifest written for a
+    different scan key, or an unreadable one, is discarded.
+    """
+
+    def __init__(self, output_dir, key):
+        self.path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self.key = key
+        self.videos = {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        if data.get("version") == MANIFEST_VERSION and data.get("scan_key") == key:
+            self.videos = data.get("videos", {})
+
+    def _entry(self, video_path):
+        entry = self.videos.get(os.path.basename(video_path))
+        if entry and entry.get("fingerprint") == file_fingerprint(video_path):
+            return entry
+        return None
+
+    def is_done(self, video_path):
+        entry = self._entry(video_path)
+        return bool(entry) and entry["status"] == "done"
+
+    def results(self, video_path):
+        """
+        Results recorded for video_path (complete or partial), or {} if none.
+        """
+        entry = self._entry(video_path)
+        return _hits_from_json(entry["results"]) if entry else {}
+
+    def resume_time(self, video_path):
+        """
+        Timestamp of the last checkpointed sample of an unfinished video, or None.
+        """
+        entry = self._entry(video_path)
+        if entry and entry["status"] == "in_progress":
+            return entry.get("checkpoint_t")
+        return None
+
+    def checkpoint(self, video_path, t, results):
+        self.videos[os.path.basename(video_path)] = {
+            "status": "in_progress",
+            "fingerprint": file_fingerprint(video_path),
+            "checkpoint_t": t,
+            "results": results,
+        }
+        self.save()
+
+    def complete(self, video_path, results):
+        self.videos[os.path.basename(video_path)] = {
+            "status": "done",
+            "fingerprint": file_fingerprint(video_path),
+            "results": results,
+        }
+        self.save()
+
+    def fail(self, video_path, results):
+        """
+        Records the results of a video whose scan failed part-way. They are
+        still reported, but the video is not done, so the next scan reads
+        it again from the start.
+        """
+        self.videos[os.path.basename(video_path)] = {
+            "status": "failed",
+            "fingerprint": file_fingerprint(video_path),
+            "results": results,
+        }
+        self.save()
+
+    def save(self):
+        with atomic_write(self.path) as f:
+            json.dump({"version": MANIFEST_VERSION, "scan_key": self.key, "videos": self.videos}, f)
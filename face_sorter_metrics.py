@@ -0,0 +1,223 @@
+# face_sorter_metrics.py
+
+import contextlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from face_sorter_files import atomic_write
+
+REPORT_FILENAME = "scan_report.json"
+STAGES = ("decode", "gate", "detect", "encode", "match", "write")
+# Run totals exported to Prometheus besides the stage timers
+PROMETHEUS_COUNTERS = (
+    ("samples", "Frames sampled"),
+    ("detector_calls", "Frames that ran face detection"),
+    ("faces_detected", "Faces found by the detector"),
+    ("matches", "Person appearances found"),
+    ("errors", "Videos that failed part-way"),
+    ("cache_hits", "Videos read from the face cache"),
+    ("videos_skipped", "Videos skipped as already complete"),
+    ("peak_rss_bytes", "Highest per-video peak resident memory of a scanning process"),
+)
+# Stats that hold the largest value seen instead of a running total
+PEAK_STATS = ("peak_rss_bytes",)
+
+
+def add_time(stats, stage, seconds):
+    """
+    Adds seconds to stats[stage + "_seconds"] when a stats dict is being collected.
+    """
+    if stats is not None:
+        key = f"{stage}_seconds"
+        stats[key] = stats.get(key, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def stage_timer(stats, stage):
+    """
+    Times the enclosed block into stats as one of STAGES.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(stats, stage, time.perf_counter() - started)
+
+
+def timed(iterable, stats, stage):
+    """
+    Yields from iterable, timing each step (e.g. decoding the next frame)
+    into stats. Closing the wrapper closes the wrapped generator.
+    """
+    iterator = iter(iterable)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                add_time(stats, stage, time.perf_counter() - started)
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close:
+            close()
+
+
+def merge_stats(stats, video_stats):
+    """
+    Adds one video's counters and timers into stats, keeping the maximum
+    for PEAK_STATS, when a stats dict is being collected.
+    """
+    if stats is None:
+        return
+    for key, value in video_stats.items():
+        if key in PEAK_STATS:
+            stats[key] = max(stats.get(key, 0), value)
+        else:
+            stats[key] = stats.get(key, 0) + value
+
+
+def reset_peak_rss():
+    """
+    Starts a new peak_rss_bytes() measurement. Only Linux can reset the
+    peak (through /proc/self/clear_refs); elsewhere the peak stays the
+    highest since the process started.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process in bytes since the last
+    reset_peak_rss(), or None where it cannot be read.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextlib.contextmanager
+def peak_memory(stats):
+    """
+    Measures the peak resident memory of this process over the enclosed
+    block into stats["peak_rss_bytes"] (keeping the larger value if one is
+    there). Meant for one video at a time per process, as in a scan worker.
+    Child processes are not included, so for a pipelined scan it covers
+    the decoding and tracking process but not the detection workers.
+    """
+    reset_peak_rss()
+    try:
+        yield
+    finally:
+        peak = peak_rss_bytes()
+        if stats is not None and peak is not None:
+            stats["peak_rss_bytes"] = max(stats.get("peak_rss_bytes", 0), peak)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class RunMetrics:
+    """
+    Collects the counters and stage timers of one scan run, overall and per
+    video, for the JSON run report and the Prometheus textfile.
+
+    Scans already keep their counters in plain stats dicts; add_video()
+    takes each finished video's dict, so collecting costs nothing per frame.
+    """
+
+    def __init__(self, settings=None):
+        self.settings = settings
+        self.started_at = _now()
+        self.started = time.perf_counter()
+        self.finished_at = None
+        self.seconds = None
+        self.status = "running"
+        self.videos = []
+
+    def add_video(self, video_path, video_stats):
+        summary = {"video": os.path.basename(video_path)}
+        summary.update(video_stats)
+        if video_stats.get("video_seconds"):
+            summary["frames_per_second"] = video_stats.get("samples", 0) / video_stats["video_seconds"]
+        self.videos.append(summary)
+
+    def finish(self, status):
+        self.status = status
+        self.finished_at = _now()
+        self.seconds = time.perf_counter() - self.started
+
+    def report(self, stats):
+        """
+        Returns the run report: run-wide totals from stats, stage times, and
+        the per-video summaries slowest first.
+        """
+        stats = stats or {}
+        return {
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "seconds": self.seconds if self.seconds is not None else time.perf_counter() - self.started,
+            "settings": self.settings,
+            "videos_scanned": len(self.videos),
+            "totals": {key: value for key, value in stats.items() if not key.endswith("_seconds")},
+            "stages": {stage: stats.get(f"{stage}_seconds", 0.0) for stage in STAGES},
+            "videos": sorted(self.videos, key=lambda video: video.get("video_seconds", 0.0), reverse=True),
+        }
+
+    def write_json(self, path, stats):
+        with atomic_write(path) as f:
+            json.dump(self.report(stats), f, indent=2)
+        return path
+
+    def write_prometheus(self, path, stats):
+        """
+        Writes the run totals in the Prometheus text format, for node_exporter's
+        textfile collector (path should end in .prom).
+        """
+        report = self.report(stats)
+        totals = report["totals"]
+        lines = [
+            "# HELP face_sorter_last_run_timestamp_seconds Unix time the last scan finished.",
+            "# TYPE face_sorter_last_run_timestamp_seconds gauge",
+            f"face_sorter_last_run_timestamp_seconds {time.time():.0f}",
+            "# HELP face_sorter_run_seconds Wall time of the last scan.",
+            "# TYPE face_sorter_run_seconds gauge",
+            f'face_sorter_run_seconds{{status="{report["status"]}"}} {report["seconds"]:.3f}',
+            "# HELP face_sorter_videos_scanned Videos scanned by the last scan.",
+            "# TYPE face_sorter_videos_scanned gauge",
+            f"face_sorter_videos_scanned {report['videos_scanned']}",
+            "# HELP face_sorter_stage_seconds Time spent per pipeline stage in the last scan.",
+            "# TYPE face_sorter_stage_seconds gauge",
+        ]
+        lines += [f'face_sorter_stage_seconds{{stage="{stage}"}} {seconds:.3f}'
+                  for stage, seconds in report["stages"].items()]
+        for key, help_text in PROMETHEUS_COUNTERS:
+            lines += [
+                f"# HELP face_sorter_{key} {help_text} in the last scan.",
+                f"# TYPE face_sorter_{key} gauge",
+                f"face_sorter_{key} {totals.get(key, 0)}",
+            ]
+        with atomic_write(path) as f:
+            f.write("\n".join(lines) + "\n")
+        return path
@@ -0,0 +1,57 @@
+# face_sorter_models.py
+
+import threading
+import time
+
+# Imported on first use instead of at startup; face_recognition loads dlib's
+# detector and encoder models as it is imported, which dominates the cost
+HEAVY_MODULES = ("face_recognition", "moviepy", "pillow_heif")
+
+_heif_lock = threading.Lock()
+_heif_registered = False
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+def register_heif_opener():
+    """
+    Lets PIL open HEIC photos. Call before opening user images; repeat
+    calls are free.
+    """
+    global _heif_registered
+    with _heif_lock:
+        if not _heif_registered:
+            import pillow_heif
+            pillow_heif.register_heif_opener()
+            _heif_registered = True
+
+
+def warm_up(stats=None):
+    """
+    Imports the heavy modules (loading the face models) so the first scan
+    or reference photo does not wait for them. If stats is a dict, the
+    seconds spent are stored in it as "warm_up_seconds".
+    """
+    started = time.perf_counter()
+    register_heif_opener()
+    import face_recognition
+    import moviepy.config
+    import moviepy.video.io.ffmpeg_reader
+    if stats is not None:
+        stats["warm_up_seconds"] = time.perf_counter() - started
+
+
+def start_warm_up():
+    """
+    Runs warm_up() once on a background daemon thread and returns the
+    thread. Imports are serialized by Python's import lock, so code that
+    needs a model meanwhile simply waits for the warm-up to get there.
+    Join the thread before forking worker processes: a fork taken in the
+    middle of an import copies the held import lock into the child.
+    """
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=warm_up, name="model-warm-up", daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
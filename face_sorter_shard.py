@@ -0,0 +1,302 @@
+# face_sorter_shard.py
+
+import argparse
+import heapq
+import json
+import os
+import socket
+import sys
+import numpy as np
+from face_sorter_backend import (
+    CACHE_DIRNAME, DETECTION_SCALE, FRAME_INTERVAL, GATE_THRESHOLD, check_distinct_names, detector_settings, list_videos,
+    scan_and_save_all,
+)
+from face_sorter_files import atomic_write
+from face_sorter_gallery import GALLERY_AGGREGATE, GALLERY_DIR, GalleryIndex
+from face_sorter_metrics import REPORT_FILENAME
+from face_sorter_store import RESULTS_DB_FILENAME, ResultsStore
+from face_sorter_video import probe_video
+
+SHARD_PLAN_FILENAME = "shard_plan.json"
+SHARD_PLAN_VERSION = 2  # 2: the plan carries the reference encodings
+SHARDS_DIRNAME = "shards"
+SHARD_CLAIM_FILENAME = "claim"
+
+
+def video_weight(video_path, balance="size"):
+    """
+    Cost estimate of scanning video_path: its size in bytes, or its
+    duration in seconds with balance="duration" (needs a probe per video,
+    but tracks scan time better when bitrates differ a lot).
+    """
+    if balance == "duration":
+        return probe_video(video_path)[2]
+    if balance == "size":
+        return os.path.getsize(video_path)
+    raise ValueError(f"balance must be 'size' or 'duration', got {balance!r}")
+
+
+def partition(weights, num_shards):
+    """
+    Splits { item: weight } into num_shards lists of similar total weight,
+    placing the heaviest items first, each on the currently lightest shard.
+    Ties are broken by item, so the same input always gives the same plan.
+    """
+    shards = [[] for _ in range(num_shards)]
+    heap = [(0, idx) for idx in range(num_shards)]
+    for item, weight in sorted(weights.items(), key=lambda pair: (-pair[1], pair[0])):
+        total, idx = heapq.heappop(heap)
+        shards[idx].append(item)
+        heapq.heappush(heap, (total + weight, idx))
+    return [sorted(shard) for shard in shards]
+
+
+def shard_dir(output_dir, index):
+    return os.path.join(output_dir, SHARDS_DIRNAME, f"shard_{index:03d}")
+
+
+def plan_shards(known_people, video_paths, output_dir, num_shards, balance="size", frame_interval=None,
+                detection_scale=None, gate_threshold=None, adaptive=False):
+    """
+    Writes output_dir/SHARD_PLAN_FILENAME, partitioning video_paths into
+    num_shards shards of similar size (or duration, see video_weight), and
+    returns the plan.
+
+    The plan records the scan settings and known_people themselves, at
+    full precision, so every shard runs the same scan whatever gallery its
+    machine has. Results are keyed by file name, so the names must be
+    distinct.
+    """
+    video_paths = [os.path.abspath(path) for path in video_paths]
+    check_distinct_names(video_paths)
+    num_shards = max(1, min(num_shards, len(video_paths)))
+    weights = {path: video_weight(path, balance) for path in video_paths}
+    settings = detector_settings(frame_interval, detection_scale, gate_threshold)
+    plan = {
+        "version": SHARD_PLAN_VERSION,
+        "people": sorted({person[0] for person in known_people}),
+        "known_people": [
+            {"name": name, "encoding": np.asarray(encoding, dtype=np.float64).tolist(), "image": image_path}
+            for name, encoding, image_path in known_people
+        ],
+        "settings": settings,
+        "adaptive": adaptive,
+        "balance": balance,
+        "shards": [
+            {"index": idx, "weight": sum(weights[path] for path in paths), "videos": paths}
+            for idx, paths in enumerate(partition(weights, num_shards))
+        ],
+    }
+    with atomic_write(os.path.join(output_dir, SHARD_PLAN_FILENAME)) as f:
+        json.dump(plan, f, indent=2)
+    return plan
+
+
+def plan_people(plan):
+    """
+    The known_people tuples a plan was made with.
+    """
+    return [(person["name"], np.array(person["encoding"], dtype=np.float64), person["image"])
+            for person in plan["known_people"]]
+
+
+def load_plan(output_dir):
+    with open(os.path.join(output_dir, SHARD_PLAN_FILENAME), "r") as f:
+        plan = json.load(f)
+    if plan.get("version") != SHARD_PLAN_VERSION:
+        raise ValueError(f"Unsupported shard plan version {plan.get('version')!r}")
+    return plan
+
+
+def check_index(plan, index):
+    if not 0 <= index < len(plan["shards"]):
+        raise ValueError(f"No shard {index}: the plan has shards 0 to {len(plan['shards']) - 1}")
+
+
+def _claimant():
+    return f"{socket.gethostname()} {os.getpid()}\n"
+
+
+def claim_shard(output_dir, plan):
+    """
+    Claims the first shard nobody has claimed yet by creating its claim
+    file exclusively (atomic on local disks and NFS), and returns its
+    index, or None when every shard is taken. Lets any number of machines
+    run "next shard" against one shared output folder.
+    """
+    for shard in plan["shards"]:
+        directory = shard_dir(output_dir, shard["index"])
+        os.makedirs(directory, exist_ok=True)
+        try:
+            fd = os.open(os.path.join(directory, SHARD_CLAIM_FILENAME), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        with os.fdopen(fd, "w") as f:
+            f.write(_claimant())
+        return shard["index"]
+    return None
+
+
+def run_shard(output_dir, index, num_workers=None, use_cache=True, progress_callback=None, stats=None,
+              control=None):
+    """
+    Scans shard index of the plan in output_dir for the people of the
+    plan with scan_and_save_all, into output_dir/shards/shard_NNN: its own
+    results store, manifest (so a rerun of the shard resumes) and run
+    report. The face cache is shared across shards. Returns the shard
+    folder.
+
+    The shard's claim file is (re)written with this host and process, also
+    when index was given rather than claimed, and the report of an earlier
+    run is removed, so shard_status shows it as claimed until it ends.
+    """
+    plan = load_plan(output_dir)
+    check_index(plan, index)
+    settings = plan["settings"]
+    directory = shard_dir(output_dir, index)
+    with atomic_write(os.path.join(directory, SHARD_CLAIM_FILENAME)) as f:
+        f.write(_claimant())
+    try:
+        os.remove(os.path.join(directory, REPORT_FILENAME))
+    except FileNotFoundError:
+        pass
+    scan_and_save_all(
+        plan_people(plan), None, directory,
+        progress_callback=progress_callback,
+        num_workers=num_workers,
+        use_cache=use_cache,
+        cache_dir=os.path.join(output_dir, CACHE_DIRNAME),
+        detection_scale=settings["detection_scale"],
+        adaptive=plan["adaptive"],
+        gate_threshold=settings["gate_threshold"],
+        stats=stats,
+        control=control,
+        video_paths=plan["shards"][index]["videos"],
+        frame_interval=settings["frame_interval"],
+    )
+    return directory
+
+
+def shard_status(output_dir, plan):
+    """
+    Returns the status of each shard: "pending", "claimed" (being
+    scanned, or its machine stopped before writing a report), or the
+    status of its run report ("completed", "cancelled" or "failed").
+    """
+    statuses = []
+    for shard in plan["shards"]:
+        directory = shard_dir(output_dir, shard["index"])
+        try:
+            with open(os.path.join(directory, REPORT_FILENAME), "r") as f:
+                statuses.append(json.load(f)["status"])
+        except (FileNotFoundError, ValueError, KeyError):
+            claimed = os.path.exists(os.path.join(directory, SHARD_CLAIM_FILENAME))
+            statuses.append("claimed" if claimed else "pending")
+    return statuses
+
+
+def merge_shards(output_dir, allow_incomplete=False):
+    """
+    Combines the shard results stores into the ResultsStore in output_dir
+    and exports the "{name}_videos.txt" files, whose paths are returned.
+
+    Rows are copied at full precision, not re-parsed from text. Within one
+    transaction the plan's people lose their rows for the videos of the
+    completed shards and get the shard rows instead, so merging again
+    gives the same store. Unless allow_incomplete is True, every shard must
+    have completed; with it, the videos of other shards keep their rows.
+    """
+    plan = load_plan(output_dir)
+    statuses = shard_status(output_dir, plan)
+    unfinished = [idx for idx, status in enumerate(statuses) if status != "completed"]
+    if unfinished and not allow_incomplete:
+        raise ValueError(f"Shards not completed: {', '.join(str(idx) for idx in unfinished)}")
+
+    # Only completed shards replace rows; the videos of the others keep theirs
+    completed = [shard for shard, status in zip(plan["shards"], statuses) if status == "completed"]
+    rows = []
+    for shard in completed:
+        db_path = os.path.join(shard_dir(output_dir, shard["index"]), RESULTS_DB_FILENAME)
+        if os.path.exists(db_path):
+            with ResultsStore(db_path) as shard_store:
+                rows.extend(shard_store.rows())
+    videos = [os.path.basename(path) for shard in completed for path in shard["videos"]]
+    with ResultsStore(os.path.join(output_dir, RESULTS_DB_FILENAME)) as store:
+        if store.is_new:
+            store.import_text(output_dir)
+        store.replace(plan["people"], videos, sorted(rows))
+        return store.export_text(output_dir, plan["people"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split a scan into shards that run on several machines")
+    parser.add_argument("output", help="shared output folder holding the plan, shards and merged results")
+    sub = parser.add_subparsers(dest="step", required=True)
+
+    plan = sub.add_parser("plan", help="partition the videos into shards")
+    plan.add_argument("--people", default=GALLERY_DIR, help="gallery of reference photos (default: gallery)")
+    plan.add_argument("--aggregate", choices=["centroid", "all"], default=GALLERY_AGGREGATE)
+    plan.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    plan.add_argument("--videos", default="videos", help="folder of .mp4 files (default: videos)")
+    plan.add_argument("--shards", type=int, required=True)
+    plan.add_argument("--balance", choices=["size", "duration"], default="size")
+    plan.add_argument("--interval", type=float, default=FRAME_INTERVAL)
+    plan.add_argument("--detection-scale", default=str(DETECTION_SCALE))
+    plan.add_argument("--gate-threshold", type=float, default=GATE_THRESHOLD)
+    plan.add_argument("--adaptive", action="store_true")
+
+    run = sub.add_parser("run", help="scan one shard (--shard) or claim the next free one, for the plan's people")
+    run.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    run.add_argument("--shard", type=int, help="shard index (default: claim the next unclaimed shard)")
+    run.add_argument("--no-cache", action="store_true")
+
+    sub.add_parser("status", help="show the state of every shard")
+
+    merge = sub.add_parser("merge", help="combine the shard results")
+    merge.add_argument("--allow-incomplete", action="store_true", help="merge even if some shards did not finish")
+
+    args = parser.parse_args(argv)
+
+    if args.step == "plan":
+        detection_scale = args.detection_scale if args.detection_scale == "auto" else float(args.detection_scale)
+        known_people = GalleryIndex.load(args.people).update(args.workers).known_people(args.aggregate)
+        result = plan_shards(known_people, list_videos(args.videos), args.output, args.shards, args.balance,
+                             args.interval, detection_scale, args.gate_threshold, args.adaptive)
+        for shard in result["shards"]:
+            print(f"shard {shard['index']}: {len(shard['videos'])} videos, weight {shard['weight']:.0f}")
+
+    elif args.step == "run":
+        plan = load_plan(args.output)
+        index = args.shard if args.shard is not None else claim_shard(args.output, plan)
+        if index is None:
+            print("Every shard is already claimed.")
+            return 0
+        try:
+            check_index(plan, index)
+            print(f"Running shard {index} on {socket.gethostname()}")
+            directory = run_shard(args.output, index, args.workers, use_cache=not args.no_cache,
+                                  progress_callback=lambda done, total, name: print(f"[{done}/{total}] {name}"))
+        except ValueError as e:
+            print(e)
+            return 1
+        print(f"Shard {index} done: {directory}")
+
+    elif args.step == "status":
+        plan = load_plan(args.output)
+        for shard, status in zip(plan["shards"], shard_status(args.output, plan)):
+            print(f"shard {shard['index']}: {status} ({len(shard['videos'])} videos)")
+
+    elif args.step == "merge":
+        try:
+            saved_files = merge_shards(args.output, args.allow_incomplete)
+        except ValueError as e:
+            print(e)
+            return 1
+        print(f"Merged results into {len(saved_files)} files")
+        for path in saved_files:
+            print(f"  {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
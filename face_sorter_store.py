@@ -0,0 +1,223 @@
+# face_sorter_store.py
+
+import csv
+import json
+import os
+import re
+import sqlite3
+from itertools import groupby
+
+RESULTS_DB_FILENAME = "results.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appearances (
+    person TEXT NOT NULL,
+    video TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    confidence REAL,
+    PRIMARY KEY (person, video, start_time, end_time)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS appearances_by_video ON appearances (video, person, start_time);
+"""
+
+_TEXT_HIT = re.compile(r"^(\d+):(\d{2})(?:-(\d+):(\d{2}))?$")
+
+
+def format_timestamp(seconds):
+    minutes = int(seconds // 60)
+    secs = int(seconds % 60)
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def format_span(start, end):
+    """
+    Formats an appearance as "MM:SS", or "MM:SS-MM:SS" when it spans time.
+    """
+    start_str, end_str = format_timestamp(start), format_timestamp(end)
+    return start_str if start_str == end_str else f"{start_str}-{end_str}"
+
+
+class ResultsStore:
+    """
+    Indexed store of scan results: one row per (person, video, start, end)
+    appearance with its match confidence (1 - face distance).
+
+    Rows are kept at full float precision in SQLite, queried by person (the
+    primary key order) or by video (secondary index), and written in
+    batched transactions. The legacy per-person "{name}_videos.txt" files,
+    CSV and JSON are produced by the export_* methods.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.is_new = not os.path.exists(db_path)
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, rows):
+        """
+        Inserts (person, video, start, end, confidence) rows in one
+        transaction; a repeated appearance keeps its highest confidence.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO appearances (person, video, start_time, end_time, confidence) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (person, video, start_time, end_time) DO UPDATE SET "
+                "confidence = max(coalesce(confidence, 0), coalesce(excluded.confidence, 0))",
+                rows,
+            )
+
+    def replace(self, people, videos, rows):
+        """
+        Replaces every row for the given people in the given videos with
+        rows, in one transaction. Rows for anyone else are left alone.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM appearances WHERE person = ? AND video = ?",
+                [(person, video) for person in people for video in videos],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO appearances (person, video, start_time, end_time, confidence) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def delete_video(self, video):
+        with self.conn:
+            self.conn.execute("DELETE FROM appearances WHERE video = ?", (video,))
+
+    def people(self):
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT person FROM appearances ORDER BY person")]
+
+    def videos(self):
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT video FROM appearances ORDER BY video")]
+
+    def by_person(self, person):
+        """
+        Returns [(video, start, end, confidence)] for person, by video then time.
+        """
+        return self.conn.execute(
+            "SELECT video, start_time, end_time, confidence FROM appearances WHERE person = ? "
+            "ORDER BY video, start_time, end_time",
+            (person,),
+        ).fetchall()
+
+    def by_video(self, video):
+        """
+        Returns [(person, start, end, confidence)] for video, by person then time.
+        """
+        return self.conn.execute(
+            "SELECT person, start_time, end_time, confidence FROM appearances WHERE video = ? "
+            "ORDER BY person, start_time, end_time",
+            (video,),
+        ).fetchall()
+
+    def iter_rows(self):
+        """
+        Iterates over (person, video, start, end, confidence) by person,
+        video and time, reading rows from the database as it goes.
+        """
+        return self.conn.execute(
+            "SELECT person, video, start_time, end_time, confidence FROM appearances "
+            "ORDER BY person, video, start_time, end_time"
+        )
+
+    def rows(self):
+        return self.iter_rows().fetchall()
+
+    def person_text_lines(self, person):
+        """
+        Lines of the legacy text format for person: "video: MM:SS, MM:SS-MM:SS".
+        Hits that format the same (e.g. samples within one second) are listed once.
+        """
+        return [
+            f"{video}: " + ", ".join(dict.fromkeys(format_span(start, end) for _, start, end, _ in hits))
+            for video, hits in groupby(self.by_person(person), key=lambda row: row[0])
+        ]
+
+    def export_text(self, output_dir, people=None):
+        """
+        Writes "{name}_videos.txt" for each person (all stored people by
+        default) and returns the written paths.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        saved_files = []
+        for person in self.people() if people is None else people:
+            output_file = os.path.join(output_dir, f"{person}_videos.txt")
+            with open(output_file, "w") as f:
+                for line in self.person_text_lines(person):
+                    f.write(line + "\n")
+            saved_files.append(output_file)
+        return saved_files
+
+    def export_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["person", "video", "start", "end", "confidence"])
+            writer.writerows(self.iter_rows())
+        return path
+
+    def export_json(self, path):
+        """
+        Writes { person: { video: [{"start", "end", "confidence"}, ...] } }
+        as indented JSON, streaming rows from the database so memory does
+        not grow with the number of appearances.
+        """
+        with open(path, "w") as f:
+            f.write("{")
+            people = groupby(self.iter_rows(), key=lambda row: row[0])
+            person_sep = "\n"
+            for person, person_rows in people:
+                f.write(f"{person_sep}  {json.dumps(person)}: {{")
+                video_sep = "\n"
+                for video, hits in groupby(person_rows, key=lambda row: row[1]):
+                    f.write(f"{video_sep}    {json.dumps(video)}: [")
+                    hit_sep = "\n"
+                    for _, _, start, end, confidence in hits:
+                        hit = json.dumps({"start": start, "end": end, "confidence": confidence}, indent=2)
+                        f.write(hit_sep + "      " + hit.replace("\n", "\n      "))
+                        hit_sep = ",\n"
+                    f.write("\n    ]")
+                    video_sep = ",\n"
+                f.write("\n  }")
+                person_sep = ",\n"
+            f.write("}" if person_sep == "\n" else "\n}")
+        return path
+
+    def import_text(self, output_dir):
+        """
+        Loads existing "{name}_videos.txt" files from output_dir, so results
+        saved before the store existed are kept. Times are whole seconds and
+        confidence is unknown (NULL). Returns the number of rows imported.
+        """
+        rows = []
+        for filename in sorted(os.listdir(output_dir)):
+            if not filename.endswith("_videos.txt"):
+                continue
+            person = filename[: -len("_videos.txt")]
+            with open(os.path.join(output_dir, filename), "r") as f:
+                for line in f:
+                    if ":" not in line:
+                        continue
+                    video, times_str = line.strip().split(":", 1)
+                    for hit in times_str.strip().split(", "):
+                        match = _TEXT_HIT.match(hit.strip())
+                        if not match:
+                            continue
+                        start = int(match.group(1)) * 60 + int(match.group(2))
+                        end = int(match.group(3)) * 60 + int(match.group(4)) if match.group(3) else start
+                        rows.append((person, video.strip(), float(start), float(end), None))
+        self.add(rows)
+        return len(rows)
@@ -0,0 +1,180 @@
+# face_sorter_video.py
+
+import collections
+import queue
+import re
+import subprocess as sp
+import threading
+import numpy as np
+
+# moviepy is imported inside the functions so importing this module stays cheap
+
+_PTS_TIME = re.compile(rb"showinfo.*? pts_time:\s*(-?[0-9.]+)")
+
+
+def probe_video(video_path):
+    """
+    Returns (width, height, duration) of the first video stream, with width
+    and height as ffmpeg will output them after applying rotation metadata.
+    """
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    infos = ffmpeg_parse_infos(video_path)
+    if not infos.get("video_found"):
+        raise IOError(f"No video stream found in {video_path}")
+    width, height = infos["video_size"]
+    if abs(infos.get("video_rotation", 0)) in (90, 270):
+        width, height = height, width
+    return width, height, infos["duration"]
+
+
+class FrameBuffers:
+    """
+    Frames for a decoder to read into. With count set, count frames are
+    allocated up front and reused in turn, so a frame stays valid until
+    count more frames have been read and no memory is allocated per frame;
+    with count None, every frame gets a fresh array.
+    """
+
+    def __init__(self, shape, count=None):
+        self.shape = shape
+        self.count = count
+        self.frames = np.empty((count,) + shape, dtype=np.uint8) if count else None
+        self.next = 0
+
+    def read(self, stream):
+        """
+        Fills the next frame from stream (readinto, no intermediate bytes)
+        and returns it, or returns None when the stream ends first.
+        """
+        if self.frames is None:
+            frame = np.empty(self.shape, dtype=np.uint8)
+        else:
+            frame = self.frames[self.next]
+            self.next = (self.next + 1) % self.count
+        view = memoryview(frame.reshape(-1))
+        filled = 0
+        while filled < len(view):
+            read = stream.readinto(view[filled:])
+            if not read:
+                return None
+            filled += read
+        return frame
+
+
+def iter_sampled_frames(video_path, interval, start_time=0.0, probe=None, buffers=None):
+    """
+    Decodes video_path once, front to back, and yields (t, frame) for one
+    frame every `interval` seconds from start_time, for t < duration.
+
+    Sampling happens inside ffmpeg (select filter keeping the first frame at
+    or after each multiple of interval, i.e. the frame get_frame(t) shows),
+    so frames in between are decoded but never converted to RGB or piped to
+    Python, and the decoder never seeks back to a keyframe the way
+    per-timestamp get_frame calls can. probe may pass in an earlier
+    probe_video(video_path) result to avoid probing twice.
+
+    With buffers set, frames are read into that many reused buffers (see
+    FrameBuffers): pass the number of frames the caller holds on to at
+    once, and copy any frame kept longer.
+    """
+    from moviepy.config import FFMPEG_BINARY
+
+    width, height, duration = probe if probe is not None else probe_video(video_path)
+    frame_bytes = width * height * 3
+    frames = FrameBuffers((height, width, 3), buffers)
+
+    cmd = [FFMPEG_BINARY, "-loglevel", "error", "-nostdin"]
+    if start_time > 0:
+        cmd += ["-ss", f"{start_time:.6f}"]
+    cmd += [
+        "-i", video_path,
+        "-an", "-sn",
+        "-vf", f"select='eq(n,0)+gt(floor(t/{interval!r}),floor(prev_t/{interval!r}))'",
+        "-fps_mode", "passthrough",
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-",
+    ]
+    proc = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE, stdin=sp.DEVNULL, bufsize=frame_bytes)
+    try:
+        idx = 0
+        while True:
+            t = start_time + idx * interval
+            if t >= duration:
+                break
+            frame = frames.read(proc.stdout)
+            if frame is None:
+                if proc.wait() != 0:
+                    raise IOError(f"ffmpeg failed on {video_path}: {proc.stderr.read().decode(errors='replace').strip()}")
+                break
+            yield t, frame
+            idx += 1
+    finally:
+        proc.stdout.close()
+        proc.terminate()
+        proc.wait()
+        proc.stderr.close()
+
+
+def iter_keyframes(video_path, min_gap=0.0, probe=None, buffers=None):
+    """
+    Yields (t, frame) for the keyframes of video_path, skipping keyframes
+    less than min_gap seconds after the last one yielded.
+
+    ffmpeg's decoder is told to skip every frame that is not a keyframe
+    (-skip_frame nokey), so the cost is one intra-frame decode per keyframe
+    however long the GOP is. Timestamps are read from the showinfo filter's
+    log on stderr. probe and buffers work as in iter_sampled_frames.
+    """
+    from moviepy.config import FFMPEG_BINARY
+
+    width, height, _ = probe if probe is not None else probe_video(video_path)
+    frame_bytes = width * height * 3
+    frames = FrameBuffers((height, width, 3), buffers)
+
+    cmd = [
+        FFMPEG_BINARY, "-hide_banner", "-nostats", "-loglevel", "info", "-nostdin",
+        "-skip_frame", "nokey",
+        "-i", video_path,
+        "-an", "-sn",
+        "-vf", f"select='isnan(prev_selected_t)+gte(t-prev_selected_t,{float(min_gap)!r})',showinfo",
+        "-fps_mode", "passthrough",
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-",
+    ]
+    proc = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE, stdin=sp.DEVNULL, bufsize=frame_bytes)
+    times = queue.Queue()
+    log_tail = collections.deque(maxlen=20)
+
+    def read_log():
+        # showinfo logs each frame before it is written to stdout
+        for line in proc.stderr:
+            match = _PTS_TIME.search(line)
+            if match:
+                times.put(float(match.group(1)))
+            else:
+                log_tail.append(line.decode(errors="replace").strip())
+        times.put(None)
+
+    reader = threading.Thread(target=read_log, daemon=True)
+    reader.start()
+    try:
+        while True:
+            frame = frames.read(proc.stdout)
+            if frame is None:
+                if proc.wait() != 0:
+                    reader.join()
+                    raise IOError(f"ffmpeg failed on {video_path}: {' / '.join(log_tail)}")
+                break
+            t = times.get()
+            if t is None:
+                break
+            yield t, frame
+    finally:
+        proc.stdout.close()
+        proc.terminate()
+        proc.wait()
+        reader.join()
+        proc.stderr.close()
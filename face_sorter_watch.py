@@ -0,0 +1,191 @@
+# face_sorter_watch.py
+
+import collections
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from face_sorter_backend import (
+    CACHE_DIRNAME, NUM_WORKERS, _init_worker, _scan_video_worker, detector_settings, hits_to_rows, worker_pool,
+)
+from face_sorter_manifest import ScanManifest, scan_key
+from face_sorter_metrics import merge_stats, stage_timer
+from face_sorter_store import RESULTS_DB_FILENAME, ResultsStore
+
+WATCH_POLL_SECONDS = 2.0
+WATCH_SETTLE_SECONDS = 5.0  # a file unchanged this long is taken to be fully written
+WATCH_RETRY_SECONDS = 60.0  # a file that failed to scan is tried again after this long
+
+
+class FolderWatcher:
+    """
+    Polls folders for .mp4 files that are new or changed, by size and
+    mtime. A file is reported once it has kept the same size and mtime for
+    settle_seconds, so footage that is still being copied or rendered is
+    left alone, and it is reported again only after it changes or when a
+    retry() is due. Polling needs nothing beyond os.scandir and works on
+    network shares, where inotify does not.
+    """
+
+    def __init__(self, video_dirs, settle_seconds=WATCH_SETTLE_SECONDS):
+        self.video_dirs = video_dirs
+        self.settle_seconds = settle_seconds
+        self.reported = {}  # path -> (size, mtime_ns) it was reported with
+        self.settling = {}  # path -> ((size, mtime_ns), monotonic time first seen so)
+        self.retries = {}  # path -> monotonic time to report it again, though unchanged
+
+    def scan(self):
+        files = {}
+        for video_dir in self.video_dirs:
+            try:
+                entries = list(os.scandir(video_dir))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name.lower().endswith(".mp4") and entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return files
+
+    def poll(self):
+        """
+        Returns (ready, removed): paths that have settled since they were
+        last reported or are due for a retry, oldest first, and reported
+        paths that disappeared.
+        """
+        now = time.monotonic()
+        files = self.scan()
+        ready = []
+        for path, signature in files.items():
+            if self.reported.get(path) == signature:
+                if now >= self.retries.get(path, float("inf")):
+                    del self.retries[path]
+                    ready.append(path)
+                continue
+            self.retries.pop(path, None)
+            seen = self.settling.get(path)
+            if seen is None or seen[0] != signature:
+                self.settling[path] = (signature, now)
+            elif signature[0] > 0 and now - seen[1] >= self.settle_seconds:
+                del self.settling[path]
+                self.reported[path] = signature
+                ready.append(path)
+        removed = [path for path in self.reported if path not in files]
+        for path in removed:
+            del self.reported[path]
+            self.retries.pop(path, None)
+        for path in [path for path in self.settling if path not in files]:
+            del self.settling[path]
+        ready.sort(key=lambda path: files[path][1])
+        return ready, removed
+
+    def retry(self, path, delay):
+        """
+        Reports path again after delay seconds even if it has not changed
+        by then. A change before that reports it as usual, once settled.
+        """
+        self.retries[path] = time.monotonic() + delay
+
+
+def _signature(video_path):
+    try:
+        stat = os.stat(video_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def watch_folder(known_people, video_dirs, output_dir, num_workers=None, settings=None, use_cache=True,
+                 control=None, on_event=None, stats=None, poll_seconds=WATCH_POLL_SECONDS,
+                 settle_seconds=WATCH_SETTLE_SECONDS, retry_seconds=WATCH_RETRY_SECONDS):
+    """
+    Keeps the results in output_dir up to date with the .mp4 files in
+    video_dirs until control (a ScanControl) is cancelled, which raises
+    ScanCancelled.
+
+    Each new or changed file is scanned on its own once it has settled
+    (see FolderWatcher), by a pool of num_workers processes that is kept
+    busy for as long as files are waiting, so a burst of arrivals queues up
+    instead of being scanned in batches that wait for their slowest video.
+    As each video finishes, its rows for known_people are replaced in the
+    ResultsStore, the "{name}_videos.txt" files are exported again and the
+    video is marked done in the ScanManifest, shared with
+    scan_and_save_all. A video whose scan hit errors keeps the faces found
+    so far but is marked failed instead, and is scanned again after
+    retry_seconds (or as soon as it changes and settles). Videos the
+    manifest already has as done and unchanged are skipped, also when the
+    watcher starts; the rows of videos that disappear are deleted. A file
+    that changes while it is being scanned is scanned again.
+
+    on_event(event, video_path, details) is called from this thread for
+    "queued", "skipped", "done" and "failed" (details has the counters and
+    the number of hits per person) and "removed". If stats is a dict, the
+    per-video counters are summed into it.
+    """
+    num_workers = num_workers or NUM_WORKERS
+    settings = settings or detector_settings()
+    cache_dir = os.path.join(output_dir, CACHE_DIRNAME) if use_cache else None
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = ScanManifest(output_dir, scan_key(known_people, settings, False))
+    names = list(dict.fromkeys(person[0] for person in known_people))
+    watcher = FolderWatcher(video_dirs, settle_seconds)
+    waiting = collections.deque()
+    running = {}  # future -> (video_path, signature when submitted)
+
+    def emit(event, video_path, details=None):
+        if on_event:
+            on_event(event, video_path, details or {})
+
+    with ResultsStore(os.path.join(output_dir, RESULTS_DB_FILENAME)) as store:
+        if store.is_new:
+            store.import_text(output_dir)
+        # The scan_videos workers, without progress events or pipelining
+        with worker_pool(num_workers, _init_worker, (known_people, cache_dir, settings, False, control, None, None),
+                         control) as pool:
+            while True:
+                if control is not None:
+                    control.checkpoint()
+                ready, removed = watcher.poll()
+                for video_path in ready:
+                    if manifest.is_done(video_path):
+                        emit("skipped", video_path)
+                    elif video_path not in waiting:
+                        waiting.append(video_path)
+                        emit("queued", video_path)
+                for video_path in removed:
+                    if video_path in waiting:
+                        waiting.remove(video_path)
+                    with stage_timer(stats, "write"):
+                        store.delete_video(os.path.basename(video_path))
+                        store.export_text(output_dir, names)
+                    emit("removed", video_path)
+
+                busy = {video_path for video_path, _ in running.values()}
+                for video_path in [path for path in waiting if path not in busy]:
+                    if len(running) >= num_workers:
+                        break
+                    waiting.remove(video_path)
+                    running[pool.submit(_scan_video_worker, video_path, 0.0)] = (video_path, _signature(video_path))
+
+                if not running:
+                    time.sleep(poll_seconds)
+                    continue
+                done, _ = wait(running, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+                for future in done:
+                    video_path, signature = running.pop(future)
+                    hits, video_stats = future.result()
+                    merge_stats(stats, video_stats)
+                    if _signature(video_path) != signature:
+                        continue  # changed or removed mid-scan; the watcher reports it again
+                    with stage_timer(stats, "write"):
+                        store.replace(names, [os.path.basename(video_path)],
+                                      hits_to_rows(os.path.basename(video_path), hits))
+                        store.export_text(output_dir, names)
+                        if video_stats.get("errors"):
+                            manifest.fail(video_path, hits)
+                        else:
+                            manifest.complete(video_path, hits)
+                    if video_stats.get("errors"):
+                        watcher.retry(video_path, retry_seconds)
+                    details = dict(video_stats)
+                    details["hits"] = {name: len(person_hits) for name, person_hits in hits.items()}
+                    emit("failed" if video_stats.get("errors") else "done", video_path, details)